@@ -0,0 +1,37 @@
+import core as sb
+import pandas as pd
+import sys
+
+#################################################################
+### Closing periods #############################################
+#################################################################
+
+# CLI front end for `core.snapshots.SnapshotStore.close`. Snapshots the
+# periods from --start through the given period, for reports over ranges
+# starting at --start (and, with --gains, ending at --end):
+#
+#   slowbooks close 2019-06 --start 2017-12 --end 2019-12 --gains
+
+def run_close(data_dir, periods, start, end, freq='M', with_gains=False):
+    if len(periods) != 1:
+        print(f'Expected the last period to close, got {periods}. Exiting.')
+        sys.exit(1)
+    if not start:
+        print('--start is required. Exiting.')
+        sys.exit(1)
+
+    try:
+        period_range = pd.period_range(start=start, end=end or periods[0], freq=freq)
+        coa = sb.data.fetch_chart_of_accounts(data_dir)
+        mj = sb.data.fetch_master_journal(data_dir, coa)
+        bd = sb.data.fetch_balance_data(data_dir) if with_gains else None
+        written = sb.snapshots.SnapshotStore(data_dir).close(coa, mj, period_range, periods[0],
+                                                             with_gains=with_gains, balance_data=bd)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if written:
+        print(f'Closed {len(written)} period(s): {written[0]} to {written[-1]}')
+    else:
+        print(f'All periods through [{periods[0]}] already closed.')
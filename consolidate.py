@@ -0,0 +1,45 @@
+import core as sb
+import pandas as pd
+import sys
+
+#################################################################
+### Consolidated statements over several books ##################
+#################################################################
+
+# CLI front end for `core.consolidation.consolidate`. The data dir is the
+# consolidated book (its CoA and consolidation map), the entity books are
+# given as files:
+#
+#   slowbooks consolidate ~/books/personal ~/books/llc --data-dir ~/books/group --start 2019-01 --end 2019-12
+
+def run_consolidate(data_dir, entity_dirs, start, end, freq='M', with_gains=False, fmt='text'):
+    if not entity_dirs:
+        print('Expected at least one entity data dir. Exiting.')
+        sys.exit(1)
+    if not start or not end:
+        print('--start and --end are required. Exiting.')
+        sys.exit(1)
+
+    try:
+        period_range = pd.period_range(start=start, end=end, freq=freq)
+        result = sb.consolidation.consolidate(entity_dirs,
+                                              sb.data.fetch_chart_of_accounts(data_dir),
+                                              sb.consolidation.fetch_account_map(data_dir),
+                                              period_range,
+                                              with_gains=with_gains)
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        sys.exit(1)
+
+    for title, write, report_data in [('Income statement', sb.reports.write_income_statement, result.cash_flow),
+                                      ('Cashflow statement', sb.reports.write_cashflow_statement, result.cash_flow),
+                                      ('Balance sheet', sb.reports.write_balance_sheet, result.balance_sheet)]:
+        if fmt == 'text':
+            sys.stdout.write(f'\n{title}\n{"=" * len(title)}\n\n')
+        write(report_data, sys.stdout, fmt)
+
+    unbalanced = result.eliminated.groupby('period').sum()
+    unbalanced = unbalanced[(unbalanced != 0) & (unbalanced.index >= period_range[0])]
+    if not unbalanced.empty:
+        print('[consolidate] eliminated balances do not net to zero in:', file=sys.stderr)
+        print(sb.reports.in_currency(unbalanced).to_string(), file=sys.stderr)
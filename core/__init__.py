@@ -1,9 +1,27 @@
-import core.budget as budget
-import core.data as data
-import core.reports as reports
+import importlib
+
+# submodules are imported on first attribute access (`core.data`, ...) so
+# that lightweight consumers like the importer and the CLI don't pay for
+# importing pandas and numpy. the eagerly importable modules (`amounts`,
+# `paths`, `profiling`, `storage`) must stay free of heavy imports for the
+# same reason, anything that needs pandas goes in the lazy list
+_LAZY_SUBMODULES = [
+    'budget',
+    'consolidation',
+    'data',
+    'history',
+    'query',
+    'reports',
+    'session',
+    'snapshots',
+]
 
 __all__ = [
-    data,
-    reports,
+    'data',
+    'reports',
 ]
 
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,47 @@
+from decimal import Decimal, InvalidOperation, ROUND_FLOOR, ROUND_HALF_EVEN
+import os
+
+# Amounts are carried as integer multiples of 10**-AMOUNT_PLACES (cents by
+# default) from parsing through the reports, so sums and balance checks are
+# exact. Files on disk keep plain decimal strings and are converted on the
+# way in and out, which means the scale can be changed without touching any
+# data.
+
+AMOUNT_PLACES = int(os.environ.get('SLOWBOOKS_AMOUNT_PLACES', 2))
+AMOUNT_SCALE = 10 ** AMOUNT_PLACES
+
+# decimal amount (str, int, float or Decimal) -> integer units, or None if
+# the value isn't a number. floats go through their shortest repr, so 0.1
+# becomes 10 cents rather than 0.1000000000000000055... cents
+def to_units(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+    if not amount.is_finite():
+        return None
+    return int((amount * AMOUNT_SCALE).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+def from_units(units):
+    return Decimal(units).scaleb(-AMOUNT_PLACES) if units is not None else None
+
+def format_units(units):
+    return str(from_units(units)) if units is not None else None
+
+# split `units` by `percentages`, rounding so that the parts always sum to
+# exactly `units * sum(percentages) / 100` (largest remainder method)
+def allocate(units, percentages):
+    shares = [Decimal(units) * Decimal(repr(p) if isinstance(p, float) else p) / 100 for p in percentages]
+    target = int(sum(shares).to_integral_value(rounding=ROUND_HALF_EVEN))
+    parts = [int(s.to_integral_value(rounding=ROUND_FLOOR)) for s in shares]
+
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - parts[i], reverse=True)
+    for i in by_remainder[:(target - sum(parts))]:
+        parts[i] += 1
+    return parts
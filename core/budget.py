@@ -1,3 +1,4 @@
+from .amounts import AMOUNT_SCALE
 from functools import reduce
 import core as sb
 import pandas as pd
@@ -48,7 +49,8 @@ def budget_vs_actuals(budgets, chart_of_accounts, master_journal, report_period_
             report_freq = report_period_range.freqstr
             budget_range = pd.period_range(interval.left, interval.right, freq=item_freq)
             item_df = (budget_range.to_frame()
-                             .assign(budget_amount=amount)
+                             # budget specs are in currency, journal amounts in units
+                             .assign(budget_amount=amount * AMOUNT_SCALE)
                              .assign(account_name=account))
 
             aligned = None
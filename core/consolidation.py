@@ -0,0 +1,110 @@
+from .paths import BALANCE_DATA_DIR, CONSOLIDATION_MAP_PATH
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+import core.data as data
+import numpy as np
+import os
+import pandas as pd
+
+# Consolidated statements over several books (one data dir per entity).
+#
+# Each entity's `statement_data` is built in its own worker process, so the
+# wall time is roughly that of the largest book. The results are then mapped
+# onto a consolidated chart of accounts and combined:
+#
+# - the mapping file has columns entity, account_name, consolidated_account
+#   and eliminate. `entity` is the name of the entity's data dir. accounts
+#   that aren't listed map to the consolidated account of the same name
+# - rows of accounts flagged `eliminate` (inter-entity balances, e.g. a loan
+#   from one entity to another) are dropped, and returned separately so it
+#   can be checked that they net out
+# - net amounts are recomputed from debits and credits against the
+#   consolidated account, in case its normal balance differs
+#
+# The CLI uses the consolidated book's own data dir for the consolidated CoA
+# (master/chart_of_accounts.csv) and the mapping (CONSOLIDATION_MAP_PATH).
+
+def consolidate(data_dirs,
+                chart_of_accounts,
+                account_map,
+                period_range,
+                with_gains=False,
+                max_workers=None):
+
+    data_dirs = [Path(d) for d in data_dirs]
+    entities = [d.name for d in data_dirs]
+    if len(set(entities)) != len(entities):
+        raise ValueError(f'Entity data dirs must have distinct names, got {entities}')
+
+    workers = max_workers or min(len(data_dirs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        statements = list(pool.map(_entity_statement_data,
+                                   data_dirs,
+                                   [period_range] * len(data_dirs),
+                                   [with_gains] * len(data_dirs)))
+
+    kept, eliminated = zip(*[_map_accounts(sd, entity, chart_of_accounts, account_map)
+                             for entity, sd in zip(entities, statements)])
+    kept = pd.concat(kept, sort=False)
+    eliminated = pd.concat(eliminated, sort=False)
+
+    sd = (data.filler_statement(chart_of_accounts, period_range)
+          .append(kept[data._get_statement_columns(kept)], sort=False)
+          .reset_index(drop=True))
+
+    return SimpleNamespace(**{
+        'statement_data': sd,
+        'cash_flow': data.cash_flow(sd, period_range),
+        'balance_sheet': data.balance_sheet(sd, period_range),
+        # debits less credits, so eliminations that offset sum to zero
+        'eliminated': (eliminated
+                       .assign(net_debit_amount=lambda df: df['debit_amount'] - df['credit_amount'])
+                       .groupby(['period', 'entity', 'source_account_name'])['net_debit_amount']
+                       .sum()),
+    })
+
+def fetch_account_map(data_dir):
+    file = data_dir / CONSOLIDATION_MAP_PATH
+    if not file.is_file():
+        return pd.DataFrame(columns=['entity', 'account_name', 'consolidated_account', 'eliminate'])
+    return (pd.read_csv(file)
+            .assign(eliminate=lambda df: df['eliminate'].fillna(False).astype(str).str.lower().isin(['true', '1', 'yes'])))
+
+# runs in a worker process
+def _entity_statement_data(data_dir, period_range, with_gains):
+    coa = data.fetch_chart_of_accounts(data_dir)
+    mj = data.fetch_master_journal(data_dir, coa)
+    bd = data.fetch_balance_data(data_dir) if with_gains and list((data_dir / BALANCE_DATA_DIR).glob('**/*')) else None
+    if with_gains and bd is None:
+        raise ValueError(f'Gains requested but no files found in [{data_dir / BALANCE_DATA_DIR}]')
+    return data.statement_data(coa, mj, period_range, with_gains=with_gains, balance_data=bd)
+
+# eliminated rows keep their source accounts (they only need debits less
+# credits), the rest are mapped onto the consolidated CoA
+def _map_accounts(stmt_data, entity, chart_of_accounts, account_map):
+    entity_map = (account_map[account_map['entity'] == entity]
+                  .set_index('account_name'))
+
+    names = stmt_data['account_name']
+    eliminate = names.map(entity_map['eliminate']).fillna(False).values == True
+    consolidated = names.map(entity_map['consolidated_account']).fillna(names)
+    unknown = sorted(set(consolidated[~eliminate]) - set(chart_of_accounts['account_name']))
+    if unknown:
+        raise ValueError(f'Accounts of [{entity}] not in the consolidated CoA and not mapped: {unknown}')
+
+    stmt_data = (stmt_data
+                 .assign(entity=entity)
+                 .assign(source_account_name=names.values)
+                 .assign(eliminate=eliminate))
+
+    coa_cols = ['type', 'account_id', 'account_tags', 'debit_increases_balance'] + \
+               [col for col in chart_of_accounts.columns if 'category_' in str(col)]
+    kept = (stmt_data[~eliminate]
+            .drop(columns=[col for col in stmt_data.columns if col in coa_cols or 'category_' in str(col)])
+            .assign(account_name=consolidated[~eliminate].values)
+            .merge(right=chart_of_accounts[['account_name'] + coa_cols], how='left', on='account_name')
+            .assign(net_amount=lambda df: np.where(df['debit_increases_balance'] == True,
+                                                   df['debit_amount'] - df['credit_amount'],
+                                                   df['credit_amount'] - df['debit_amount'])))
+    return kept, stmt_data[eliminate]
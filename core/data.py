@@ -1,18 +1,21 @@
+from .amounts import AMOUNT_SCALE, to_units
+from .paths import (BALANCE_DATA_DIR, CHART_OF_ACCOUNTS_PATH, MASTER_JOURNAL_PATH, METADATA_PATH,
+                    OPENING_BALANCES_PATH, is_journal_partitioned, journal_partition_files)
+from .profiling import profiled
 from types import SimpleNamespace
 import numpy as np
 import pandas as pd
 
-BALANCE_DATA_DIR = 'balance-data'
-CHART_OF_ACCOUNTS_PATH = 'master/chart_of_accounts.csv'
-MASTER_JOURNAL_PATH = 'master/master_journal.csv'
-METADATA_PATH = 'master/metadata.yaml'
-
 DUMMY_TRANSACTION_ID = -1
 
+# amounts are read from disk as decimals and carried as int64 units (see
+# core.amounts) through every frame in this module
+
 ###############################################################################
 #### Raw data #################################################################
 ###############################################################################
 
+@profiled('data.fetch_chart_of_accounts')
 def fetch_chart_of_accounts(data_dir):
     raw_coa = pd.read_csv(data_dir / CHART_OF_ACCOUNTS_PATH)
     cat_cols = (raw_coa['category']
@@ -27,20 +30,97 @@ def fetch_chart_of_accounts(data_dir):
             .replace({'account_tags': {np.nan: ''}})
             .rename(columns={'id': 'account_id', 'name': 'account_name'}))
 
-def fetch_master_journal(data_dir, chart_of_accounts):
-    mj_file = data_dir / MASTER_JOURNAL_PATH
-    mj = (pd.read_csv(mj_file)
-          .astype({'date': 'datetime64[ns]'})
-          .rename(columns={'id': 'transaction_id'}))
-
-    return _build_journal(chart_of_accounts, mj)
+# `start` / `end` (inclusive) restrict the journal to a date window. entries
+# before `start` are replaced by one opening balance entry per account and
+# action, so balances within the window come out the same as with the full
+# journal
+#
+# with the partitioned layout only the partitions overlapping the window are
+# read, and the opening balances come from the stored per-year totals
+@profiled('data.fetch_master_journal')
+def fetch_master_journal(data_dir, chart_of_accounts, start=None, end=None):
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    if is_journal_partitioned(data_dir):
+        partitions = [f for f in journal_partition_files(data_dir)
+                      if (start is None or int(f.stem) >= start.year) and
+                         (end is None or int(f.stem) <= end.year)]
+        mj = (pd.concat([_read_journal_file(f) for f in partitions])
+              if partitions else _empty_journal())
+        prior_totals = _prior_year_totals(data_dir, start) if start is not None else None
+    else:
+        mj = _read_journal_file(data_dir / MASTER_JOURNAL_PATH)
+        prior_totals = None
+
+    if start is not None:
+        mj = pd.concat([_opening_balance_entries(mj[mj['date'] < start], prior_totals, start),
+                        mj[mj['date'] >= start]],
+                       sort=False)
+    if end is not None:
+        mj = mj[mj['date'] <= end]
+
+    return _build_journal(chart_of_accounts, mj.reset_index(drop=True))
+
+def _read_journal_file(file):
+    return (pd.read_csv(file)
+            .astype({'date': 'datetime64[ns]'})
+            .assign(amount=lambda df: _to_units(df['amount'], file))
+            .rename(columns={'id': 'transaction_id'}))
+
+def _empty_journal():
+    return (pd.DataFrame(columns=['transaction_id', 'date', 'description', 'account_id', 'account_name', 'action', 'amount'])
+            .astype({'transaction_id': 'int64', 'date': 'datetime64[ns]', 'account_id': 'int64', 'amount': 'int64'}))
+
+# None before anything has been posted to the partitioned layout
+def _prior_year_totals(data_dir, start):
+    file = data_dir / OPENING_BALANCES_PATH
+    if not file.is_file():
+        return None
+
+    totals = pd.read_csv(file)
+    prior_years = totals.loc[totals['year'] < start.year, 'year']
+    if prior_years.empty:
+        return None
+    return (totals[totals['year'] == prior_years.max()]
+            .drop(columns=['year'])
+            .assign(amount=lambda df: _to_units(df['amount'], file)))
+
+def _opening_balance_entries(prior_journal, prior_totals, start):
+    group_cols = ['account_id', 'account_name', 'action']
+    return (pd.concat([prior_journal[group_cols + ['amount']], prior_totals], sort=False)
+            .groupby(group_cols, as_index=False)['amount']
+            .sum()
+            .pipe(lambda df: df[df['amount'] != 0])
+            .assign(transaction_id=DUMMY_TRANSACTION_ID)
+            .assign(date=start - pd.Timedelta(days=1))
+            .assign(description='Opening balance'))
 
+@profiled('data.fetch_balance_data')
 def fetch_balance_data(data_dir):
     files = [f for f in (data_dir / BALANCE_DATA_DIR).glob('**/*') if f.is_file()]
+    # a blank balance is no observation
     return pd.concat([pd.read_csv(f)
                         .astype({'date': 'datetime64[ns]'})
+                        .dropna(subset=['balance'])
+                        .assign(balance=lambda df: _to_units(df['balance'], f))
                      for f in files])
 
+# amounts read as floats -> integer units, rounded half to even on the
+# decimal value like core.amounts.to_units. products that land within float
+# error of a half (2.675 * 100 = 267.49999999999997) are redone with it
+def _to_units(amounts, source):
+    values = pd.to_numeric(amounts, errors='coerce').values.astype('float64')
+    missing = np.isnan(values)
+    if missing.any():
+        raise ValueError(f'Missing or invalid amounts in [{source}], lines {(amounts.index[missing] + 2).tolist()[:10]}')
+
+    scaled = values * AMOUNT_SCALE
+    units = np.round(scaled)
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= 1e-6 + 1e-12 * np.abs(scaled)
+    units[near_half] = [to_units(value) for value in values[near_half].tolist()]
+    return pd.Series(units.astype('int64'), index=amounts.index)
+
 ###############################################################################
 #### Core DataFrame shapes ####################################################
 ###############################################################################
@@ -49,6 +129,7 @@ def fetch_balance_data(data_dir):
 # (blank) line item for each (account, period) combination in all
 # downstream reports
 
+@profiled('data.statement_data')
 def statement_data(chart_of_accounts,
                    journal,
                    period_range,
@@ -56,25 +137,7 @@ def statement_data(chart_of_accounts,
                    balance_data=None):
 
     statement =\
-        (chart_of_accounts
-         # generate all combinations of (account, period) by faking
-         # a cartesian join using a special key
-         .assign(crossjoin_key=1)
-         .merge(right=(period_range
-                       .to_frame(name='period')
-                       .assign(crossjoin_key=1)),
-                on='crossjoin_key')
-         .drop('crossjoin_key', 1)
-         .rename(columns={'id': 'account_id', 'name': 'account_name'})
-         .assign(date=lambda df: df['period'].dt.start_time)
-         .assign(credit_amount=0.0)
-         .assign(debit_amount=0.0)
-         .assign(net_amount=0.0)
-         .assign(description='')
-         .assign(action=None)
-         .assign(transaction_id=DUMMY_TRANSACTION_ID)
-         .pipe(lambda df: df[_get_statement_columns(df)])
-
+        (filler_statement(chart_of_accounts, period_range)
          # combine with the actual journal data
          .append(other=_journal_to_statement(journal, period_range), sort=False)
          .pipe(lambda df: _journal_to_statement(df, period_range)))
@@ -89,6 +152,28 @@ def statement_data(chart_of_accounts,
             .pipe(lambda df: _journal_to_statement(df, period_range))
             .append(statement))
 
+# one blank line item per (account, period)
+def filler_statement(chart_of_accounts, period_range):
+    return (chart_of_accounts
+            # generate all combinations of (account, period) by faking
+            # a cartesian join using a special key
+            .assign(crossjoin_key=1)
+            .merge(right=(period_range
+                          .to_frame(name='period')
+                          .assign(crossjoin_key=1)),
+                   on='crossjoin_key')
+            .drop('crossjoin_key', 1)
+            .rename(columns={'id': 'account_id', 'name': 'account_name'})
+            .assign(date=lambda df: df['period'].dt.start_time)
+            .assign(credit_amount=0)
+            .assign(debit_amount=0)
+            .assign(net_amount=0)
+            .assign(description='')
+            .assign(action=None)
+            .assign(transaction_id=DUMMY_TRANSACTION_ID)
+            .pipe(lambda df: df[_get_statement_columns(df)]))
+
+@profiled('data.build_journal')
 def _build_journal(chart_of_accounts,
                    journal_like,
                    join_key='account_id'):
@@ -130,19 +215,23 @@ def _get_statement_columns(statement_like):
 #### Report data ##############################################################
 ###############################################################################
 
+@profiled('data.general_ledger')
 def general_ledger(stmt_data):
-    grouped = stmt_data.groupby('account_name')
-    by_account = {k: grouped.get_group(k) for k in grouped.groups}
+    return dict(iter_general_ledger(stmt_data))
 
-    output = {}
-    for acct_name, entries in by_account.items():
+# lazy variant of `general_ledger` - yields (account_name, ledgers) pairs one
+# account at a time so streaming writers don't have to hold every ledger
+def iter_general_ledger(stmt_data):
+    grouped = stmt_data.groupby('account_name')
+    for acct_name in grouped.groups:
+        entries = grouped.get_group(acct_name)
         debits = entries.loc[entries['action'] == 'debit', ['date', 'transaction_id', 'description', 'debit_amount']]
         credits = entries.loc[entries['action'] == 'credit', ['date', 'transaction_id', 'description', 'credit_amount']]
-        output[acct_name] = {'debit': debits.sort_values('date'),
-                             'credit': credits.sort_values('date')}
-    return output
+        yield acct_name, {'debit': debits.sort_values('date'),
+                          'credit': credits.sort_values('date')}
 
 
+@profiled('data.cash_flow')
 def cash_flow(stmt_data, period_range):
     sd = stmt_data[(stmt_data['period'] >= period_range[0]) &
                    (stmt_data['period'] <= period_range[-1])]
@@ -200,6 +289,7 @@ def cash_flow(stmt_data, period_range):
         'tax_expense': tax_expense,
     })
 
+@profiled('data.balance_sheet')
 def balance_sheet(stmt_data, period_range):
 
     # - group journal entries by account
@@ -228,10 +318,86 @@ def _get_report_index(stmt_data):
             [col for col in stmt_data.columns if 'category_' in str(col)] +
             ['account_name'])
 
+###############################################################################
+#### Multi-frequency rollup ###################################################
+###############################################################################
+
+# build the statement once at the finest of `freqs` and derive every coarser
+# view from it by aggregation: flows (the cash flow series) are summed per
+# coarse period, balances (the balance sheet) take the last base period
+# within each coarse period
+#
+# returns {freq: SimpleNamespace(period_range, cash_flow, balance_sheet)}
+#
+# note: with `with_gains`, gains are interpolated at the base frequency, so
+# coarse views can differ slightly from a standalone build at that frequency
+
+@profiled('data.multi_frequency_statements')
+def multi_frequency_statements(chart_of_accounts,
+                               journal,
+                               start,
+                               end,
+                               freqs,
+                               with_gains=False,
+                               balance_data=None):
+
+    base_freq = min(freqs, key=_period_length)
+    base_range = pd.period_range(start=start, end=end, freq=base_freq)
+    sd = statement_data(chart_of_accounts, journal, base_range, with_gains=with_gains, balance_data=balance_data)
+    cf = cash_flow(sd, base_range)
+    bs = balance_sheet(sd, base_range)
+
+    views = {}
+    for freq in freqs:
+        if freq == base_freq:
+            views[freq] = SimpleNamespace(period_range=base_range, cash_flow=cf, balance_sheet=bs)
+            continue
+
+        if not (base_range.asfreq(freq, how='start') == base_range.asfreq(freq, how='end')).all():
+            raise ValueError(f'Periods at frequency [{base_freq}] do not nest within periods at [{freq}]')
+
+        views[freq] = SimpleNamespace(
+            period_range=pd.period_range(start=base_range[0].asfreq(freq),
+                                         end=base_range[-1].asfreq(freq),
+                                         freq=freq),
+            cash_flow=SimpleNamespace(**{k: _rollup_flows(v, freq) for k, v in vars(cf).items()}),
+            balance_sheet=_rollup_balances(bs, freq))
+
+    return views
+
+def _period_length(freq):
+    period = pd.Period('2000-01-01', freq=freq)
+    return period.end_time - period.start_time
+
+def _rollup_flows(flows, freq):
+    # empty series lose the period dtype on their index, nothing to roll up
+    if flows.empty:
+        return flows
+
+    index_names = list(flows.index.names)
+    return (flows
+            .rename('amount')
+            .reset_index()
+            .assign(period=lambda df: df['period'].dt.asfreq(freq))
+            .groupby(index_names)['amount']
+            .sum(min_count=1)
+            .rename(flows.name))
+
+def _rollup_balances(bs_data, freq):
+    index_names = list(bs_data.index.names)
+    return (bs_data
+            .reset_index()
+            .sort_values('period', kind='mergesort')
+            .assign(period=lambda df: df['period'].dt.asfreq(freq))
+            .groupby(index_names)
+            .last()
+            .pipe(lambda df: df[bs_data.columns]))
+
 ###############################################################################
 #### Generated entries ########################################################
 ###############################################################################
 
+@profiled('data.generate_inferred_gains')
 def _generate_inferred_gains(chart_of_accounts,
                              stmt_data,
                              raw_balance_data,
@@ -282,31 +448,49 @@ def _generate_inferred_gains(chart_of_accounts,
 
     return (pd.concat(gain_entries)
             .dropna(subset=['amount'])
+            # interpolated gains fall between units
+            .assign(amount=lambda df: df['amount'].round().astype('int64'))
             .reset_index()
             .drop(columns=['type', 'category_0', 'category_1', 'account_id'])
             .pipe(lambda df: _build_journal(chart_of_accounts, df, join_key='account_name'))
             .pipe(lambda df: df[_get_journal_columns(df)]))
 
+# closing entries move the net activity of each closing account (income,
+# expense, ...) within a period into its `closing_account`. one netted entry
+# is generated per (account, period) rather than one per source line
+@profiled('data.generate_closing_entries')
 def _generate_closing_entries(chart_of_accounts, stmt_data, period_range):
-    return (chart_of_accounts
-            .pipe(lambda df: df.loc[df['closing_account'].notna(), ['account_name', 'closing_account']])
-            .assign(crossjoin_key=1)
-            .merge(right=period_range.to_frame(name='period').assign(crossjoin_key=1),
-                   on='crossjoin_key')
-            .drop('crossjoin_key', 1)
-            .set_index(['period', 'account_name'])
-            .merge(right=(stmt_data.set_index(['period', 'account_name'])
-                          .sort_index()
-                          .rename_axis(['period', 'account_name'])
-                          .dropna(subset=['net_amount'])),
-                   how='inner',
-                   on=['period', 'account_name'])
-            .pipe(lambda df: df[df['net_amount'] != 0])
-            .reset_index()
-            .pipe(lambda df: df[['period', 'closing_account', 'date', 'description', 'net_amount', 'action']])
-            .rename(columns={'closing_account': 'account_name', 'net_amount': 'amount'})
-            .assign(action=lambda df: np.where(df['action'] == 'debit', 'credit', 'debit'))
-            .assign(amount=lambda df: df['amount'] * -1)
+    coa = chart_of_accounts.set_index('account_name')
+    closing_accounts = coa['closing_account'].dropna()
+
+    net = (stmt_data
+           .loc[stmt_data['account_name'].isin(closing_accounts.index) &
+                stmt_data['period'].isin(period_range), ['account_name', 'period', 'net_amount']]
+           .groupby(['account_name', 'period'])['net_amount']
+           .sum()
+           .pipe(lambda s: s[s != 0]))
+
+    source_names = net.index.get_level_values('account_name')
+    periods = net.index.get_level_values('period')
+    target = (coa
+              .reindex(closing_accounts.reindex(source_names).values)
+              .rename_axis('account_name')
+              .reset_index())
+
+    # a positive net balance on a debit-normal account is carried into the
+    # closing account as a debit, and vice versa
+    source_dib = coa['debit_increases_balance'].reindex(source_names).values == True
+    target_dib = target['debit_increases_balance'].values == True
+    amount = net.abs().values
+    is_debit = (net.values > 0) == source_dib
+
+    return (target
+            .assign(period=periods)
+            .assign(date=periods.end_time.normalize())
+            .assign(description=('Closing entry for: ' + source_names).values)
+            .assign(action=np.where(is_debit, 'debit', 'credit'))
+            .assign(net_amount=np.where(is_debit == target_dib, amount, amount * -1))
+            .assign(debit_amount=np.where(is_debit, amount, 0))
+            .assign(credit_amount=np.where(is_debit, 0, amount))
             .assign(transaction_id=DUMMY_TRANSACTION_ID)
-            .pipe(lambda df: _build_journal(chart_of_accounts, df, join_key='account_name')))
-
+            .pipe(lambda df: df[_get_journal_columns(df)]))
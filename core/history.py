@@ -0,0 +1,156 @@
+from .amounts import AMOUNT_PLACES
+from .paths import BALANCE_DATA_DIR, CHART_OF_ACCOUNTS_PATH, MASTER_JOURNAL_DIR, MASTER_JOURNAL_PATH
+from .session import REPORT_TYPES, ReportSession, _range_key
+from .storage import atomic_write
+from contextlib import contextmanager
+from pathlib import Path
+import functools
+import hashlib
+import json
+import os
+import pandas as pd
+import pickle
+import subprocess
+import tempfile
+
+# Reports as of past commits of a data dir kept in git.
+#
+# The inputs to every report are identified by the git blob hashes of the
+# CoA, the master journal (either layout) and the balance data at a commit,
+# read with `git ls-tree` - no checkout needed. Results are cached on disk
+# under those hashes plus the report parameters and a hash of the report code
+# (the `core` sources), so any commit whose inputs match a previous one (e.g.
+# commits that only touched /source) is served from the cache, until the code
+# computing the reports changes.
+#
+# On a cache miss the blobs are written to a temporary data dir straight
+# from the object store (`git cat-file --batch`) and the report is computed
+# there with a regular ReportSession.
+
+HISTORY_PATHS = [CHART_OF_ACCOUNTS_PATH, MASTER_JOURNAL_PATH, MASTER_JOURNAL_DIR, BALANCE_DATA_DIR]
+
+def default_cache_dir():
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'slowbooks' / 'history'
+
+class ReportHistory:
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = Path(data_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.repo_dir = Path(_git(self.data_dir, 'rev-parse', '--show-toplevel').decode().strip())
+        self.prefix = _git(self.data_dir, 'rev-parse', '--show-prefix').decode().strip()
+        self.hits = 0
+        self.misses = 0
+
+    def render_report(self, commit, report, period_range, with_gains=False, fmt='text'):
+        if report not in REPORT_TYPES:
+            raise ValueError(f'Unknown report [{report}], expected one of {REPORT_TYPES}')
+
+        blobs = self.blobs(commit)
+        params = ['rendered', report, _range_key(period_range), with_gains, fmt]
+        return self._cached(blobs, params, f'.{fmt}',
+                            lambda session: session.render_report(report, period_range, with_gains, fmt),
+                            lambda f: f.read_text(),
+                            lambda f, text: f.write(text))
+
+    def balance_sheet(self, commit, period_range, with_gains=False):
+        blobs = self.blobs(commit)
+        params = ['balance_sheet', _range_key(period_range), with_gains]
+        return self._cached(blobs, params, '.pkl',
+                            lambda session: session.report_data('balance_sheet', period_range, with_gains),
+                            lambda f: pd.read_pickle(f),
+                            lambda f, bs: pickle.dump(bs, f, protocol=pickle.HIGHEST_PROTOCOL),
+                            mode='wb')
+
+    # balance sheet lines that differ between two commits, in units like
+    # the balance sheet itself
+    def diff_balance_sheets(self, commit_a, commit_b, period_range, with_gains=False):
+        before = self.balance_sheet(commit_a, period_range, with_gains)['bs_amount']
+        after = self.balance_sheet(commit_b, period_range, with_gains)['bs_amount']
+        return (pd.concat([before.rename('before_amount'), after.rename('after_amount')], axis=1, sort=True)
+                .fillna(0)
+                .astype('int64')
+                .assign(change_amount=lambda df: df['after_amount'] - df['before_amount'])
+                .pipe(lambda df: df[df['change_amount'] != 0]))
+
+    # {path relative to the data dir: blob hash} for the report inputs
+    def blobs(self, commit):
+        output = _git(self.repo_dir, 'ls-tree', '-r', '-z', commit, '--',
+                      *[self.prefix + path for path in HISTORY_PATHS])
+        blobs = {}
+        for line in output.decode().split('\0'):
+            if not line:
+                continue
+            meta, path = line.split('\t', 1)
+            _, obj_type, obj_hash = meta.split()
+            if obj_type == 'blob':
+                blobs[path[len(self.prefix):]] = obj_hash
+
+        if CHART_OF_ACCOUNTS_PATH not in blobs:
+            raise ValueError(f'No [{CHART_OF_ACCOUNTS_PATH}] in commit [{commit}]')
+        if not any(path == MASTER_JOURNAL_PATH or path.startswith(MASTER_JOURNAL_DIR + '/') for path in blobs):
+            raise ValueError(f'No master journal ([{MASTER_JOURNAL_PATH}] or [{MASTER_JOURNAL_DIR}]) in commit [{commit}]')
+        return blobs
+
+    # `dump` writes the result to an open file, in `mode`
+    def _cached(self, blobs, params, suffix, compute, load, dump, mode='w'):
+        key = hashlib.sha256(json.dumps({'blobs': sorted(blobs.items()),
+                                         'params': params,
+                                         'amount_places': AMOUNT_PLACES,
+                                         'code': _code_version()}).encode()).hexdigest()
+        cache_file = self.cache_dir / f'{key}{suffix}'
+        if cache_file.is_file():
+            self.hits += 1
+            return load(cache_file)
+
+        self.misses += 1
+        with self._workspace(blobs) as workspace:
+            session = ReportSession(workspace)
+            session.refresh()
+            result = compute(session)
+
+        with atomic_write(cache_file, mode) as f:
+            dump(f, result)
+        return result
+
+    @contextmanager
+    def _workspace(self, blobs):
+        with tempfile.TemporaryDirectory(prefix='slowbooks-history-') as tmp_dir:
+            workspace = Path(tmp_dir)
+            (workspace / BALANCE_DATA_DIR).mkdir()
+
+            paths = list(blobs)
+            contents = _cat_blobs(self.repo_dir, [blobs[p] for p in paths])
+            for path, content in zip(paths, contents):
+                (workspace / path).parent.mkdir(parents=True, exist_ok=True)
+                (workspace / path).write_bytes(content)
+            yield workspace
+
+# hash of the `core` sources, so cached results are recomputed whenever the
+# report logic (or the cache format) changes
+@functools.lru_cache(maxsize=None)
+def _code_version():
+    code = hashlib.sha256()
+    for file in sorted(Path(__file__).parent.glob('*.py')):
+        code.update(file.name.encode())
+        code.update(file.read_bytes())
+    return code.hexdigest()
+
+def _git(cwd, *args, stdin=None):
+    try:
+        return subprocess.run(['git', *args], cwd=cwd, input=stdin, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    except FileNotFoundError:
+        raise ValueError('git not found')
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f'git {args[0]} failed: {e.stderr.decode().strip()}')
+
+# one git process for all blobs
+def _cat_blobs(repo_dir, hashes):
+    output = _git(repo_dir, 'cat-file', '--batch', stdin=''.join(f'{h}\n' for h in hashes).encode())
+    contents, pos = [], 0
+    for _ in hashes:
+        header_end = output.index(b'\n', pos)
+        size = int(output[pos:header_end].split()[2])
+        contents.append(output[(header_end + 1):(header_end + 1 + size)])
+        pos = header_end + 1 + size + 1
+    return contents
@@ -0,0 +1,30 @@
+# Data dir layout.
+
+BALANCE_DATA_DIR = 'balance-data'
+CHART_OF_ACCOUNTS_PATH = 'master/chart_of_accounts.csv'
+CONSOLIDATION_MAP_PATH = 'master/consolidation_map.csv'
+FINGERPRINTS_PATH = 'master/fingerprints.json'
+MANIFEST_PATH = 'master/manifest.json'
+MASTER_JOURNAL_PATH = 'master/master_journal.csv'
+METADATA_PATH = 'master/metadata.yaml'
+PARSER_PLUGIN_PATH = 'user_code/parser_plugin.py'
+SNAPSHOTS_DIR = 'snapshots'
+SUGGESTIONS_PATH = 'master/suggestions.json'
+
+# optional year-partitioned layout for the master journal, used instead of
+# MASTER_JOURNAL_PATH when the directory exists: one plain CSV per year, plus
+# per-account cumulative debit/credit totals through the end of each year
+MASTER_JOURNAL_DIR = 'master/journal'
+JOURNAL_PARTITION_GLOB = '[0-9][0-9][0-9][0-9].csv'
+OPENING_BALANCES_PATH = 'master/journal/opening_balances.csv'
+
+def is_journal_partitioned(data_dir):
+    return (data_dir / MASTER_JOURNAL_DIR).is_dir()
+
+def journal_partition_files(data_dir):
+    return sorted((data_dir / MASTER_JOURNAL_DIR).glob(JOURNAL_PARTITION_GLOB))
+
+def master_journal_files(data_dir):
+    if is_journal_partitioned(data_dir):
+        return journal_partition_files(data_dir)
+    return [data_dir / MASTER_JOURNAL_PATH]
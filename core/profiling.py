@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from functools import wraps
+from types import SimpleNamespace
+import threading
+import time
+import tracemalloc
+
+# Stage-level instrumentation for the pipeline. Each stage (a decorated
+# function or a `with stage(...)` block) reports one record per run to every
+# registered listener:
+#
+#   SimpleNamespace(name, depth, seconds, rows, memory)
+#
+# - `depth` is the nesting level, stages called from within other stages
+#   are counted in their parent's time too
+# - `rows` is the length of the stage's result where that makes sense
+#   (frames, series, lists, dicts), else None
+# - `memory` is the net change in traced memory in bytes, only available
+#   while tracemalloc is tracing, else None
+#
+# With no listeners registered stages do nothing but a list check, so the
+# instrumentation stays in place permanently.
+#
+#   with profiling.collect() as records:
+#       sd = sb.data.statement_data(coa, mj, period_range)
+#   print(profiling.format_stages(records))
+
+_listeners = []
+_local = threading.local()
+
+def add_listener(listener):
+    _listeners.append(listener)
+    return listener
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+@contextmanager
+def collect():
+    records = []
+    add_listener(records.append)
+    try:
+        yield records
+    finally:
+        remove_listener(records.append)
+
+@contextmanager
+def stage(name):
+    record = SimpleNamespace(name=name, depth=0, seconds=None, rows=None, memory=None)
+    if not _listeners:
+        yield record
+        return
+
+    record.depth = getattr(_local, 'depth', 0)
+    _local.depth = record.depth + 1
+    tracing = tracemalloc.is_tracing()
+    start_memory = tracemalloc.get_traced_memory()[0] if tracing else None
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if tracing and tracemalloc.is_tracing():
+            record.memory = tracemalloc.get_traced_memory()[0] - start_memory
+        _local.depth = record.depth
+        for listener in list(_listeners):
+            listener(record)
+
+# decorator form of `stage`, records the row count of the return value
+def profiled(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _listeners:
+                return fn(*args, **kwargs)
+
+            with stage(name) as record:
+                result = fn(*args, **kwargs)
+                record.rows = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+def _count_rows(result):
+    shape = getattr(result, 'shape', None)
+    if shape:
+        return shape[0]
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return None
+
+# one line per stage, nested under the stage it was called from. repeated
+# runs of the same stage at the same position are summed into one line
+def format_stages(records):
+    # records complete innermost first - rebuild the call tree from their
+    # depths, then walk it top down
+    children = {}
+    for r in records:
+        children.setdefault(r.depth, []).append((r, children.pop(r.depth + 1, [])))
+
+    stages = {}
+    def visit(nodes, path):
+        for r, sub in nodes:
+            s = stages.setdefault(path + (r.name,), SimpleNamespace(calls=0, seconds=0.0, rows=None, memory=None))
+            s.calls += 1
+            s.seconds += r.seconds
+            if r.rows is not None:
+                s.rows = (s.rows or 0) + r.rows
+            if r.memory is not None:
+                s.memory = (s.memory or 0) + r.memory
+            visit(sub, path + (r.name,))
+    visit([node for depth in sorted(children) for node in children[depth]], ())
+
+    header = ['stage', 'calls', 'total ms', 'rows', 'memory KiB']
+    lines = [[('  ' * (len(path) - 1)) + path[-1],
+              str(s.calls),
+              f'{s.seconds * 1000:,.1f}',
+              f'{s.rows:,}' if s.rows is not None else '',
+              f'{s.memory / 1024:,.1f}' if s.memory is not None else '']
+             for path, s in stages.items()]
+
+    widths = [max(len(row[i]) for row in [header] + lines) for i in range(len(header))]
+    return '\n'.join('  '.join([row[0].ljust(widths[0])] + [v.rjust(w) for v, w in zip(row[1:], widths[1:])])
+                     for row in [header] + lines)
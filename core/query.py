@@ -0,0 +1,138 @@
+from .amounts import to_units
+from .profiling import stage
+import numpy as np
+import pandas as pd
+import re
+
+# Indexed lookups over a journal (the output of `data.fetch_master_journal`)
+# for ad-hoc queries in notebooks. The indexes are built once:
+#
+# - rows sorted by (account_id, date), for account + date range queries
+# - rows sorted by date, and by amount, for range queries on either
+# - a token -> rows index over the descriptions
+#
+# so each query is a binary search or a dict lookup rather than a scan of
+# the whole frame. Queries return Selections (sorted row positions) that
+# combine with & and |, and `.frame()` turns one into a journal slice:
+#
+#   q = sb.query.JournalQuery(mj)
+#   q.account('groceries', start='2019-01-01', end='2019-03-31').frame()
+#   (q.amount_near(42.50, tolerance=1) & q.text('hardware')).frame()
+#
+# Amounts in queries are in currency, the journal itself is in units (see
+# core.amounts).
+
+class JournalQuery:
+    def __init__(self, journal):
+        with stage('query.index') as s:
+            self.journal = journal.reset_index(drop=True)
+            s.rows = len(self.journal)
+
+            account_ids = self.journal['account_id'].values
+            dates = self.journal['date'].values
+            self._by_account_date = np.lexsort((dates, account_ids))
+            self._account_ids = account_ids[self._by_account_date]
+            self._account_dates = dates[self._by_account_date]
+
+            self._by_date = np.argsort(dates, kind='stable')
+            self._dates = dates[self._by_date]
+
+            # the split amount, whichever side it's on
+            amounts = (self.journal['debit_amount'] + self.journal['credit_amount']).values
+            self._by_amount = np.argsort(amounts, kind='stable')
+            self._amounts = amounts[self._by_amount]
+
+            self._account_names = (self.journal[['account_name', 'account_id']]
+                                   .drop_duplicates()
+                                   .set_index('account_name')['account_id']
+                                   .to_dict())
+            self._build_description_index()
+
+    def all(self):
+        return Selection(self, np.arange(len(self.journal)))
+
+    # `account` is an account id or name, `start` / `end` are inclusive
+    def account(self, account, start=None, end=None):
+        account_id = self._account_names.get(account, account)
+        lo = np.searchsorted(self._account_ids, account_id, side='left')
+        hi = np.searchsorted(self._account_ids, account_id, side='right')
+        dates = self._account_dates[lo:hi]
+        first = lo + (np.searchsorted(dates, _timestamp(start), side='left') if start is not None else 0)
+        last = lo + (np.searchsorted(dates, _timestamp(end), side='right') if end is not None else len(dates))
+        return Selection(self, self._by_account_date[first:last])
+
+    def date(self, start=None, end=None):
+        first = np.searchsorted(self._dates, _timestamp(start), side='left') if start is not None else 0
+        last = np.searchsorted(self._dates, _timestamp(end), side='right') if end is not None else len(self._dates)
+        return Selection(self, self._by_date[first:last])
+
+    def amount(self, low=None, high=None):
+        return self._amount_units(to_units(low) if low is not None else None,
+                                  to_units(high) if high is not None else None)
+
+    def amount_near(self, amount, tolerance=0):
+        units, tolerance_units = to_units(amount), to_units(tolerance)
+        return self._amount_units(units - tolerance_units, units + tolerance_units)
+
+    # rows whose description contains all words of `terms`
+    def text(self, terms):
+        postings = [self._postings.get(token, _EMPTY) for token in _tokenize(terms)]
+        if not postings:
+            return self.all()
+        positions = postings[0]
+        for p in postings[1:]:
+            positions = np.intersect1d(positions, p, assume_unique=True)
+        return Selection(self, positions)
+
+    # regex search, run over the distinct descriptions only
+    def description(self, pattern, flags=re.IGNORECASE):
+        regex = re.compile(pattern, flags)
+        codes = [code for code, desc in enumerate(self._descriptions) if regex.search(desc)]
+        return Selection(self, np.concatenate([_EMPTY] + [self._rows_for_code(c) for c in codes]))
+
+    def _amount_units(self, low, high):
+        first = np.searchsorted(self._amounts, low, side='left') if low is not None else 0
+        last = np.searchsorted(self._amounts, high, side='right') if high is not None else len(self._amounts)
+        return Selection(self, self._by_amount[first:last])
+
+    def _build_description_index(self):
+        codes, self._descriptions = pd.factorize(self.journal['description'].fillna(''))
+        self._by_code = np.argsort(codes, kind='stable')
+        self._code_bounds = np.searchsorted(codes[self._by_code], np.arange(len(self._descriptions) + 1))
+
+        codes_by_token = {}
+        for code, desc in enumerate(self._descriptions):
+            for token in set(_tokenize(desc)):
+                codes_by_token.setdefault(token, []).append(code)
+
+        self._postings = {token: np.sort(np.concatenate([self._rows_for_code(c) for c in token_codes]))
+                          for token, token_codes in codes_by_token.items()}
+
+    def _rows_for_code(self, code):
+        return self._by_code[self._code_bounds[code]:self._code_bounds[code + 1]]
+
+# a set of journal rows, as sorted positions into `query.journal`
+class Selection:
+    def __init__(self, query, positions):
+        self.query = query
+        self.positions = np.unique(positions)
+
+    def __and__(self, other):
+        return Selection(self.query, np.intersect1d(self.positions, other.positions, assume_unique=True))
+
+    def __or__(self, other):
+        return Selection(self.query, np.union1d(self.positions, other.positions))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def frame(self):
+        return self.query.journal.iloc[self.positions]
+
+_EMPTY = np.array([], dtype='int64')
+
+def _timestamp(value):
+    return np.datetime64(pd.Timestamp(value), 'ns')
+
+def _tokenize(text):
+    return re.findall(r'[0-9a-z]+', str(text).lower())
@@ -1,20 +1,30 @@
+from .amounts import AMOUNT_SCALE
+from .profiling import profiled
+from html import escape
 from itertools import zip_longest
+from types import SimpleNamespace
+import csv
+import numpy as np
 import pandas as pd
 
 ###########################################################################
 #### Plain text / CLI friendly reports ####################################
 ###########################################################################
 
+@profiled('reports.general_ledger')
 def general_ledger(journal_by_account):
     output = []
     for acct_name, ledgers in journal_by_account.items():
+        ledgers = in_currency(ledgers)
         header = f'{acct_name}\n{"-" * len(acct_name)}'
         ledgers = as_columns(ledgers['debit'], ledgers['credit'])
         output.append(''.join([header, ledgers, '\n\n']))
 
     return ''.join(output)
 
+@profiled('reports.income_statement')
 def income_statement(data):
+    data = in_currency(data)
 
     return f"""
 Regular income
@@ -59,7 +69,9 @@ Net income
     """
 
 
+@profiled('reports.cashflow_statement')
 def cashflow_statement(data):
+    data = in_currency(data)
 
     return f"""
 Net income 
@@ -93,7 +105,9 @@ Cash to assets
 {pivot(data.flows_to_assets, 'period')}
         """
 
+@profiled('reports.balance_sheet')
 def balance_sheet(bs_data):
+    bs_data = in_currency(bs_data)
 
     assets = bs_data.loc[bs_data.index.get_level_values('type') == 'asset', 'bs_amount'].droplevel('type')
     liability = bs_data.loc[bs_data.index.get_level_values('type') == 'liability', 'bs_amount'].droplevel('type')
@@ -117,6 +131,19 @@ def balance_sheet(bs_data):
 #### Dataframe utils ######################################################
 ###########################################################################
 
+# core.data carries amounts as int64 units - convert to currency only when
+# rendering. accepts a Series of amounts, a frame (only `*amount` columns
+# are converted), or a dict / SimpleNamespace of either
+def in_currency(data):
+    if isinstance(data, SimpleNamespace):
+        return SimpleNamespace(**in_currency(vars(data)))
+    if isinstance(data, dict):
+        return {k: in_currency(v) for k, v in data.items()}
+    if isinstance(data, pd.Series):
+        return data / AMOUNT_SCALE
+    return data.assign(**{col: data[col] / AMOUNT_SCALE
+                          for col in data.columns if str(col).endswith('amount')})
+
 # native pandas pivot can't do subtotals for arbitrary levels
 # within a multilevel index - do that here
 def pivot(df, column, subtotal_lvls=[], row_totals=True, col_totals=True):
@@ -183,3 +210,227 @@ def as_columns(*inputs, spacing='  |  '):
     output = '\n'.join(out_lines)
     return output
 
+def iter_columns(*blocks, spacing='  |  '):
+    # streaming counterpart to `as_columns` - each block is a (width, lines)
+    # pair, where `lines` can be any iterable of already rendered lines
+    widths = [width for width, _ in blocks]
+    for lines in zip_longest(*[lines for _, lines in blocks], fillvalue=''):
+        yield spacing.join([line.ljust(width) for line, width in zip(lines, widths)])
+
+###########################################################################
+#### Streaming writers ####################################################
+###########################################################################
+
+# The reports above build the whole output as one string. The writers below
+# render `chunksize` rows at a time straight to an open file handle, so the
+# first rows hit the file immediately and memory use doesn't grow with the
+# size of the book. Supported formats are the keys of WRITERS.
+
+CHUNK_SIZE = 1000
+
+@profiled('reports.write_general_ledger')
+def write_general_ledger(journal_by_account, f, fmt='text', chunksize=CHUNK_SIZE):
+    # accepts either the dict from `data.general_ledger` or the lazy
+    # (account_name, ledgers) pairs from `data.iter_general_ledger`
+    items = journal_by_account.items() if hasattr(journal_by_account, 'items') else journal_by_account
+
+    writer = WRITERS[fmt](f, chunksize)
+    writer.begin()
+    for acct_name, ledgers in items:
+        ledgers = in_currency(ledgers)
+        writer.ledger(acct_name, ledgers['debit'], ledgers['credit'])
+    writer.end()
+
+@profiled('reports.write_income_statement')
+def write_income_statement(data, f, fmt='text', chunksize=CHUNK_SIZE):
+    _write_sections(_income_statement_sections(in_currency(data)), f, fmt, chunksize)
+
+@profiled('reports.write_cashflow_statement')
+def write_cashflow_statement(data, f, fmt='text', chunksize=CHUNK_SIZE):
+    _write_sections(_cashflow_statement_sections(in_currency(data)), f, fmt, chunksize)
+
+@profiled('reports.write_balance_sheet')
+def write_balance_sheet(bs_data, f, fmt='text', chunksize=CHUNK_SIZE):
+    _write_sections(_balance_sheet_sections(in_currency(bs_data)), f, fmt, chunksize)
+
+def _write_sections(sections, f, fmt, chunksize):
+    writer = WRITERS[fmt](f, chunksize)
+    writer.begin()
+    for title, df in sections:
+        writer.section(title, df)
+    writer.end()
+
+# sections are generated lazily so that each one is computed right before
+# it is written, rather than all of them up front
+
+def _income_statement_sections(data):
+    yield 'Regular income', pivot(data.regular_income, 'period')
+    yield 'Tax deferred income', pivot(data.tax_deferred_income, 'period')
+    yield 'Noncash income', pivot(data.noncash_income, 'period')
+    yield 'Income subtotal', data.income_total.to_frame().T
+    yield 'Tax total', pivot(data.tax_expense, 'period')
+    yield 'Income net of tax', data.post_tax_total.to_frame().T
+    yield 'Regular expenses', pivot(data.regular_expense, 'period')
+    yield 'Noncash expenses', pivot(data.noncash_expense, 'period')
+    yield 'Expense total', data.expense_total.to_frame().T
+    yield 'Net income', data.net_income.to_frame().T
+
+def _cashflow_statement_sections(data):
+    yield 'Net income', data.net_income.to_frame().T
+    yield 'Subtract non-cash income', pivot(data.noncash_income, 'period')
+    yield 'Add-back non-cash expenses', pivot(data.noncash_expense, 'period')
+    yield 'Cashflow for period', data.cashflow.to_frame().T
+    yield 'Repayment of principal', pivot(data.flows_to_liability, 'period')
+    yield 'Free cashflow to equity', data.free_cashflow_to_equity.to_frame().T
+    yield 'Cash to assets', pivot(data.flows_to_assets, 'period')
+
+def _balance_sheet_sections(bs_data):
+    for title, acct_type in [('Assets', 'asset'), ('Liability', 'liability'), ('Equity', 'equity')]:
+        amounts = bs_data.loc[bs_data.index.get_level_values('type') == acct_type, 'bs_amount'].droplevel('type')
+        yield title, pivot(amounts, 'period', ['category_0'], row_totals=False)
+
+class TextWriter:
+    def __init__(self, f, chunksize):
+        self.f = f
+        self.chunksize = chunksize
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def section(self, title, df):
+        self.f.write(f'{title}\n{"-" * len(title)}\n')
+        _, lines = _text_block(df, True, self.chunksize)
+        for line in lines:
+            self.f.write(line + '\n')
+        self.f.write('\n')
+
+    def ledger(self, acct_name, debits, credits):
+        self.f.write(f'{acct_name}\n{"-" * len(acct_name)}\n')
+        blocks = [_text_block(debits, False, self.chunksize),
+                  _text_block(credits, False, self.chunksize)]
+        for line in iter_columns(*blocks):
+            self.f.write(line + '\n')
+        self.f.write('\n\n')
+
+class CsvWriter:
+    def __init__(self, f, chunksize):
+        self.writer = csv.writer(f, lineterminator='\n')
+        self.chunksize = chunksize
+        self.wrote_ledger_header = False
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def section(self, title, df):
+        self.writer.writerow([title])
+        self.writer.writerow(_header(df, True))
+        for rows in _iter_rows(df, True, self.chunksize, _raw_value):
+            self.writer.writerows(rows)
+        self.writer.writerow([])
+
+    def ledger(self, acct_name, debits, credits):
+        # a single long-format table reads better as CSV than two side-by-side
+        # tables per account
+        if not self.wrote_ledger_header:
+            self.writer.writerow(['account_name', 'action', 'date', 'transaction_id', 'description', 'amount'])
+            self.wrote_ledger_header = True
+
+        for action, df in [('debit', debits), ('credit', credits)]:
+            for rows in _iter_rows(df, False, self.chunksize, _raw_value):
+                self.writer.writerows([[acct_name, action] + row for row in rows])
+
+class HtmlWriter:
+    def __init__(self, f, chunksize):
+        self.f = f
+        self.chunksize = chunksize
+
+    def begin(self):
+        self.f.write('<!DOCTYPE html>\n<html>\n<body>\n')
+
+    def end(self):
+        self.f.write('</body>\n</html>\n')
+
+    def section(self, title, df):
+        self.f.write(f'<h2>{escape(title)}</h2>\n')
+        self._table(df, True)
+
+    def ledger(self, acct_name, debits, credits):
+        self.f.write(f'<h2>{escape(str(acct_name))}</h2>\n')
+        for action, df in [('debit', debits), ('credit', credits)]:
+            self.f.write(f'<h3>{action}</h3>\n')
+            self._table(df, False)
+
+    def _table(self, df, index):
+        header = ''.join(f'<th>{escape(h)}</th>' for h in _header(df, index))
+        self.f.write(f'<table border="1">\n<thead><tr>{header}</tr></thead>\n<tbody>\n')
+        for rows in _iter_rows(df, index, self.chunksize, _display_value):
+            self.f.write(''.join('<tr>' + ''.join(f'<td>{escape(v)}</td>' for v in row) + '</tr>\n'
+                                 for row in rows))
+        self.f.write('</tbody>\n</table>\n')
+
+WRITERS = {
+    'text': TextWriter,
+    'csv': CsvWriter,
+    'html': HtmlWriter,
+}
+
+def _text_block(df, index, chunksize):
+    # two passes over the frame: the first only tracks column widths, the
+    # second renders lines. nothing but the current chunk is held in memory
+    header = _header(df, index)
+    widths = [len(h) for h in header]
+    for rows in _iter_rows(df, index, chunksize, _display_value):
+        for row in rows:
+            widths = [max(w, len(v)) for w, v in zip(widths, row)]
+
+    def lines():
+        yield _text_line(header, widths)
+        for rows in _iter_rows(df, index, chunksize, _display_value):
+            for row in rows:
+                yield _text_line(row, widths)
+
+    return len(_text_line(header, widths)), lines()
+
+def _text_line(vals, widths, spacing='  '):
+    return spacing.join([val.rjust(width) for val, width in zip(vals, widths)])
+
+def _header(df, index):
+    index_names = [str(n) if n is not None else '' for n in df.index.names] if index else []
+    return index_names + [str(c) for c in df.columns]
+
+def _iter_rows(df, index, chunksize, format_value):
+    # yields lists of formatted rows, `chunksize` rows at a time
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:(start + chunksize)]
+        rows = []
+        for idx, vals in zip(chunk.index, chunk.itertuples(index=False, name=None)):
+            idx = (idx if isinstance(idx, tuple) else (idx,)) if index else ()
+            rows.append([format_value(v) for v in idx + vals])
+        yield rows
+
+def _display_value(val):
+    if val is None or val is pd.NaT:
+        return ''
+    if isinstance(val, float):
+        if np.isnan(val):
+            return ''
+        float_format = pd.options.display.float_format
+        return float_format(val) if float_format else f'{val:,.2f}'
+    if isinstance(val, pd.Timestamp):
+        return val.strftime('%Y-%m-%d') if val == val.normalize() else str(val)
+    return str(val)
+
+def _raw_value(val):
+    if val is None or val is pd.NaT:
+        return ''
+    if isinstance(val, float):
+        return '' if np.isnan(val) else repr(val)
+    if isinstance(val, pd.Timestamp):
+        return val.strftime('%Y-%m-%d') if val == val.normalize() else val.isoformat()
+    return str(val)
@@ -0,0 +1,133 @@
+from .paths import BALANCE_DATA_DIR, CHART_OF_ACCOUNTS_PATH, master_journal_files
+from .snapshots import SnapshotStore
+from collections import OrderedDict
+import core.data as data
+import core.reports as reports
+import io
+
+REPORT_TYPES = [
+    'general_ledger',
+    'income_statement',
+    'cashflow_statement',
+    'balance_sheet',
+]
+
+# A session keeps a book's raw data and every computed stage in memory so
+# that repeated report queries (different ranges, frequencies, with and
+# without gains) don't reload the CSVs and rebuild the statement each time.
+#
+# `refresh` compares a stat-only signature of the data dir against the one
+# taken at the last load - any change to the CoA, the master journal or the
+# balance data drops the in-memory state and reloads it.
+#
+# Computed results are kept least recently used first, and the oldest are
+# dropped past `max_cached` so a long-running session doesn't grow without
+# bound.
+#
+# Cash flow and balance sheet data for closed periods come from the book's
+# snapshots (see core.snapshots).
+
+MAX_CACHED_RESULTS = 64
+
+class ReportSession:
+    def __init__(self, data_dir, max_cached=MAX_CACHED_RESULTS):
+        self.data_dir = data_dir
+        self.max_cached = max_cached
+        self.signature = None
+        self.chart_of_accounts = None
+        self.journal = None
+        self.balance_data = None
+        self.snapshots = SnapshotStore(data_dir)
+        self.cache = OrderedDict()
+
+    def refresh(self):
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+
+        self.chart_of_accounts = data.fetch_chart_of_accounts(self.data_dir)
+        self.journal = data.fetch_master_journal(self.data_dir, self.chart_of_accounts)
+        self.balance_data = data.fetch_balance_data(self.data_dir) if self._balance_data_files() else None
+        self.cache = OrderedDict()
+        self.signature = signature
+        return True
+
+    def statement_data(self, period_range, with_gains=False):
+        self._check_gains(with_gains)
+        return self._cached(('statement_data', _range_key(period_range), with_gains),
+                            lambda: data.statement_data(self.chart_of_accounts,
+                                                        self.journal,
+                                                        period_range,
+                                                        with_gains=with_gains,
+                                                        balance_data=self.balance_data))
+
+    def report_data(self, report, period_range, with_gains=False):
+        if report not in REPORT_TYPES:
+            raise ValueError(f'Unknown report [{report}], expected one of {REPORT_TYPES}')
+
+        self._check_gains(with_gains)
+
+        # only the general ledger needs the statement over the whole range,
+        # the snapshots build what the open periods need (reusing the whole
+        # statement if it's cached anyway)
+        stmt_key = ('statement_data', _range_key(period_range), with_gains)
+        snapshot_reports = lambda: self._cached(('snapshots', _range_key(period_range), with_gains),
+                                                lambda: self.snapshots.reports(self.chart_of_accounts,
+                                                                               self.journal,
+                                                                               period_range,
+                                                                               with_gains=with_gains,
+                                                                               balance_data=self.balance_data,
+                                                                               stmt_data=self.cache.get(stmt_key)))
+        if report == 'general_ledger':
+            compute = lambda: data.general_ledger(self.statement_data(period_range, with_gains))
+        elif report == 'balance_sheet':
+            compute = lambda: snapshot_reports().balance_sheet
+        else:
+            # the income and cashflow statements render the same data
+            report = 'cash_flow'
+            compute = lambda: snapshot_reports().cash_flow
+
+        return self._cached((report, _range_key(period_range), with_gains), compute)
+
+    def render_report(self, report, period_range, with_gains=False, fmt='text'):
+        if fmt not in reports.WRITERS:
+            raise ValueError(f'Unknown format [{fmt}], expected one of {list(reports.WRITERS)}')
+
+        def render():
+            output = io.StringIO()
+            report_data = self.report_data(report, period_range, with_gains)
+            getattr(reports, f'write_{report}')(report_data, output, fmt=fmt)
+            return output.getvalue()
+
+        return self._cached(('rendered', report, _range_key(period_range), with_gains, fmt), render)
+
+    def _cached(self, key, compute):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        result = compute()
+        self.cache[key] = result
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return result
+
+    def _check_gains(self, with_gains):
+        if with_gains and self.balance_data is None:
+            raise ValueError(f'Gains requested but no files found in [{BALANCE_DATA_DIR}]')
+
+    def _signature(self):
+        files = ([self.data_dir / CHART_OF_ACCOUNTS_PATH] +
+                 master_journal_files(self.data_dir) +
+                 self._balance_data_files())
+        signature = []
+        for f in files:
+            st = f.stat()
+            signature.append((str(f), st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def _balance_data_files(self):
+        return sorted(f for f in (self.data_dir / BALANCE_DATA_DIR).glob('**/*') if f.is_file())
+
+def _range_key(period_range):
+    return (period_range.freqstr, str(period_range[0]), str(period_range[-1]))
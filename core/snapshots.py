@@ -0,0 +1,267 @@
+from .amounts import AMOUNT_PLACES, format_units
+from .paths import SNAPSHOTS_DIR
+from .profiling import profiled
+from .storage import atomic_write
+from pandas.util import hash_pandas_object
+from pathlib import Path
+from types import SimpleNamespace
+import core.data as data
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+import pickle
+
+# Stored cash flow and balance sheet results for closed periods.
+#
+# `close` snapshots each period of a range: the period's slice of every cash
+# flow series and of the balance sheet, pickled, plus a CSV mirror of the
+# amounts that diffs nicely in git. `reports` then serves the closed periods
+# at the start of a range from the snapshots and only computes the rest.
+# The open part of the balance sheet is the cumulative net amount of the
+# open periods, carried forward from the last closed period's balances.
+#
+# Every snapshot records a checksum of what it was computed from: the CoA and
+# every journal row dated up to the end of its period (the balance sheet is
+# cumulative). Gains are interpolated between balance observations, so with
+# gains that extends to the period of each account's next observation (or the
+# end of the range), and covers the balance data up to there too. A snapshot
+# whose checksum no longer matches isn't used, and is replaced or deleted on
+# the next `close`.
+#
+# Closing entries only start at the first period of a report range, so a
+# snapshot is only used for ranges that start where the one it was closed
+# with did. Gains also depend on where the range ends, so with gains the
+# whole range has to match.
+#
+# Layout, per frequency (with a '-gains' suffix for gains):
+#
+#   snapshots/M/index.csv      period, range_start, range_end, checksum
+#   snapshots/M/2019-01.pkl
+#   snapshots/M/2019-01.csv
+
+CHECKSUM_COLUMNS = ['transaction_id', 'date', 'account_id', 'account_name', 'description',
+                    'action', 'debit_amount', 'credit_amount']
+
+BALANCE_CHECKSUM_COLUMNS = ['account_name', 'date', 'balance']
+
+INDEX_COLUMNS = ['period', 'range_start', 'range_end', 'checksum']
+
+class SnapshotStore:
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+
+    # snapshots the periods of `period_range` up to and including `through`
+    # that don't have a valid snapshot yet, returns the periods written
+    @profiled('snapshots.close')
+    def close(self, chart_of_accounts, journal, period_range, through, with_gains=False, balance_data=None):
+        through = pd.Period(through, freq=period_range.freq)
+        if through not in period_range:
+            raise ValueError(f'Period [{through}] is not within [{period_range[0]}] to [{period_range[-1]}]')
+
+        result = self.reports(chart_of_accounts, journal, period_range, with_gains, balance_data)
+        amounts, series = _flatten(result.cash_flow, result.balance_sheet)
+        amounts_by_period = dict(list(amounts.groupby('period')))
+
+        snapshot_dir = self._snapshot_dir(period_range, with_gains)
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        index = _read_index(snapshot_dir)
+
+        # stale snapshots up to `through` are rewritten below, drop the rest
+        for period in result.invalidated:
+            if period > through:
+                for suffix in ['pkl', 'csv']:
+                    (snapshot_dir / f'{period}.{suffix}').unlink()
+                del index[str(period)]
+
+        written = []
+        for period in period_range[period_range <= through]:
+            if period in result.closed:
+                continue
+
+            snapshot = {
+                'period': period,
+                'checksum': result.checksums[period],
+                'amounts': amounts_by_period[period],
+                'series': series,
+            }
+            with atomic_write(snapshot_dir / f'{period}.pkl', 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with atomic_write(snapshot_dir / f'{period}.csv') as f:
+                _mirror(snapshot['amounts']).to_csv(f, index=False)
+            index[str(period)] = [str(period)] + _range_key(period_range, with_gains) + [snapshot['checksum']]
+            written.append(period)
+
+        _write_index(snapshot_dir, index)
+        return written
+
+    # {cash_flow, balance_sheet} as `data.cash_flow` / `data.balance_sheet`
+    # return them, plus the `closed` periods served from snapshots and the
+    # periods whose snapshots are stale (`invalidated`). read only, stale
+    # snapshots are left for `close` to replace
+    #
+    # `stmt_data`, if given, must be `data.statement_data` over the same
+    # range - it's sliced for the open periods instead of building a new one
+    @profiled('snapshots.reports')
+    def reports(self, chart_of_accounts, journal, period_range, with_gains=False, balance_data=None, stmt_data=None):
+        snapshot_dir = self._snapshot_dir(period_range, with_gains)
+        index = _read_index(snapshot_dir)
+        sums = checksums(chart_of_accounts, journal, period_range, with_gains, balance_data)
+
+        closed, invalidated = [], []
+        for i, period in enumerate(period_range):
+            row = index.get(str(period))
+            if row is None or row[1:3] != _range_key(period_range, with_gains):
+                continue
+            if row[3] != sums[period]:
+                invalidated.append(period)
+            elif len(closed) == i:
+                closed.append(period)
+
+        if not closed:
+            if stmt_data is None:
+                stmt_data = data.statement_data(chart_of_accounts, journal, period_range,
+                                                with_gains=with_gains, balance_data=balance_data)
+            return SimpleNamespace(cash_flow=data.cash_flow(stmt_data, period_range),
+                                   balance_sheet=data.balance_sheet(stmt_data, period_range),
+                                   checksums=sums,
+                                   closed=closed,
+                                   invalidated=invalidated)
+
+        snapshots = [pd.read_pickle(snapshot_dir / f'{period}.pkl') for period in closed]
+        amounts = [s['amounts'] for s in snapshots]
+        series = snapshots[0]['series']
+
+        open_range = period_range[len(closed):]
+        if len(open_range):
+            # gains are interpolated over the whole range, so they need the
+            # full statement. otherwise the open periods' rows will do
+            if stmt_data is None and with_gains:
+                stmt_data = data.statement_data(chart_of_accounts, journal, period_range,
+                                                with_gains=with_gains, balance_data=balance_data)
+            elif stmt_data is None:
+                stmt_data = data.statement_data(chart_of_accounts,
+                                                journal[journal['date'] >= open_range[0].start_time],
+                                                open_range)
+            sd = stmt_data[stmt_data['period'] >= open_range[0]]
+
+            # balances carry on from the last closed period
+            carried = (amounts[-1]
+                       .pipe(lambda df: df[df['report'] == 'balance_sheet'])
+                       .set_index('account_id')['amount'])
+            bs = (data.balance_sheet(sd, open_range)
+                  .assign(bs_amount=lambda df: df['bs_amount'] + df['account_id'].map(carried).fillna(0).astype('int64')))
+
+            open_amounts, series = _flatten(data.cash_flow(sd, open_range), bs)
+            amounts.append(open_amounts)
+
+        return SimpleNamespace(**vars(_unflatten(pd.concat(amounts, sort=False), series)),
+                               checksums=sums,
+                               closed=closed,
+                               invalidated=invalidated)
+
+    def _snapshot_dir(self, period_range, with_gains):
+        return self.data_dir / SNAPSHOTS_DIR / (period_range.freqstr + ('-gains' if with_gains else ''))
+
+# {period: checksum of the inputs its snapshot depends on}
+def checksums(chart_of_accounts, journal, period_range, with_gains=False, balance_data=None):
+    common = [_frame_hash(chart_of_accounts), period_range.freqstr, AMOUNT_PLACES]
+    journal_hashes = _cumulative_hashes(journal, CHECKSUM_COLUMNS)
+    if with_gains:
+        balance_hashes = _cumulative_hashes(balance_data, BALANCE_CHECKSUM_COLUMNS)
+        horizons = _gains_horizons(balance_data, period_range)
+
+    sums = {}
+    for period in period_range:
+        horizon = horizons[period] if with_gains else period
+        inputs = common + _hash_through(journal_hashes, horizon)
+        if with_gains:
+            inputs += [str(horizon)] + _hash_through(balance_hashes, horizon)
+        sums[period] = hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+    return sums
+
+# (dates, running hash) of the rows of `df` in date order. per-row hashes are
+# summed (mod 2**64) rather than hashed in sequence, so the checksum doesn't
+# depend on row order
+def _cumulative_hashes(df, columns):
+    order = np.argsort(df['date'].values, kind='stable')
+    return (df['date'].values[order],
+            np.cumsum(hash_pandas_object(df[columns], index=False).values[order], dtype='uint64'))
+
+# [number of rows, running hash] of the rows dated up to the end of `period`
+def _hash_through(hashes, period):
+    dates, row_hashes = hashes
+    num_rows = np.searchsorted(dates, np.datetime64(period.end_time, 'ns'), side='right')
+    return [int(num_rows), int(row_hashes[num_rows - 1]) if num_rows else 0]
+
+# {period: last period its gains depend on}. a period's gains are interpolated
+# towards each account's next balance observation in the range, and are zero
+# after an account's last one
+def _gains_horizons(balance_data, period_range):
+    observed = [sorted(set(periods)) for _, periods in
+                (balance_data['date'].dt.to_period(period_range.freqstr)
+                 .groupby(balance_data['account_name'].values))]
+
+    horizons = {}
+    for period in period_range:
+        next_observed = [min((p for p in periods if p >= period), default=period) for periods in observed]
+        horizons[period] = min(max(next_observed, default=period), period_range[-1])
+    return horizons
+
+def _range_key(period_range, with_gains):
+    return [str(period_range[0]), str(period_range[-1]) if with_gains else '']
+
+def _frame_hash(df):
+    return hashlib.sha256(hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+# snapshots are stored as one flat frame of amounts (report, index levels,
+# amount) rather than as the report objects themselves, which are slow to
+# unpickle and concatenate. `series` keeps what's needed to rebuild them
+def _flatten(cash_flow, balance_sheet):
+    series = {key: (list(s.index.names), s.name, s.dtype) for key, s in vars(cash_flow).items()}
+    amounts = pd.concat([s.rename('amount').reset_index().assign(report=key)
+                         for key, s in vars(cash_flow).items()
+                         # empty series lose the period dtype on their index
+                         if not s.empty] +
+                        [balance_sheet.rename(columns={'bs_amount': 'amount'}).reset_index().assign(report='balance_sheet')],
+                        sort=False)
+    series['balance_sheet'] = (list(balance_sheet.index.names), None, balance_sheet['bs_amount'].dtype)
+    return amounts, series
+
+def _unflatten(amounts, series):
+    by_report = dict(list(amounts.groupby('report', sort=False)))
+    empty = amounts.iloc[:0]
+
+    cash_flow = {}
+    for key, (names, name, dtype) in series.items():
+        if key == 'balance_sheet':
+            continue
+        rows = by_report.get(key, empty)
+        cash_flow[key] = (rows.set_index(names)['amount'].astype(dtype).rename(name) if not rows.empty
+                          else pd.Series([], index=pd.MultiIndex.from_arrays([[]] * len(names), names=names),
+                                         dtype=dtype, name=name))
+
+    # in account order, as `data.balance_sheet` returns it
+    names = series['balance_sheet'][0]
+    balance_sheet = (by_report['balance_sheet']
+                     .sort_values('account_id', kind='mergesort')
+                     .set_index(names)[['account_id', 'amount']]
+                     .astype('int64')
+                     .rename(columns={'amount': 'bs_amount'}))
+    return SimpleNamespace(cash_flow=SimpleNamespace(**cash_flow), balance_sheet=balance_sheet)
+
+# the snapshot's amounts as plain decimals, one row per series / account
+def _mirror(amounts):
+    return (amounts[['report', 'account_name', 'amount']]
+            .assign(account_name=lambda df: df['account_name'].fillna(''))
+            .assign(amount=lambda df: [format_units(int(units)) if pd.notna(units) else '' for units in df['amount']]))
+
+def _read_index(snapshot_dir):
+    file = snapshot_dir / 'index.csv'
+    if not file.is_file():
+        return {}
+    return {row[0]: row for row in pd.read_csv(file, dtype=str, keep_default_na=False)[INDEX_COLUMNS].values.tolist()}
+
+def _write_index(snapshot_dir, index):
+    with atomic_write(snapshot_dir / 'index.csv') as f:
+        pd.DataFrame(sorted(index.values()), columns=INDEX_COLUMNS).to_csv(f, index=False)
@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import tempfile
+
+# Writes go to a temp file in the destination dir which is renamed over the
+# destination once fully written and synced, so a crash mid-write leaves
+# either the old or the new file - never a truncated one.
+@contextmanager
+def atomic_write(file, mode='w'):
+    file = Path(file)
+    Path.mkdir(file.parent, parents=True, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=file.parent, prefix=f'.{file.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_file, file.stat().st_mode if file.exists() else 0o644)
+        os.replace(tmp_file, file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+        raise
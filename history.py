@@ -0,0 +1,59 @@
+import core as sb
+import pandas as pd
+import sys
+
+#################################################################
+### Reports as of past commits ##################################
+#################################################################
+
+# CLI front end for `core.history.ReportHistory`:
+#
+#   slowbooks history HEAD~3 --report balance_sheet --start 2018-01 --end 2019-12
+#   slowbooks history-diff v2019-close HEAD --start 2019-12 --end 2019-12
+
+def run_history(data_dir, commits, report, start, end, freq='M', with_gains=False, fmt='text'):
+    history, period_range = _open_history(data_dir, commits, 1, start, end, freq)
+
+    try:
+        output = history.render_report(commits[0], report, period_range, with_gains, fmt)
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        sys.exit(1)
+
+    sys.stdout.write(output)
+    _print_cache_stats(history)
+
+def run_history_diff(data_dir, commits, start, end, freq='M', with_gains=False):
+    history, period_range = _open_history(data_dir, commits, 2, start, end, freq)
+
+    try:
+        diff = history.diff_balance_sheets(commits[0], commits[1], period_range, with_gains)
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        sys.exit(1)
+
+    print(f'Balance sheet changes from [{commits[0]}] to [{commits[1]}]:\n')
+    if diff.empty:
+        print('No changes.')
+    else:
+        pd.options.display.float_format = '{:,.2f}'.format
+        print(sb.reports.in_currency(diff).to_string())
+    _print_cache_stats(history)
+
+def _open_history(data_dir, commits, num_commits, start, end, freq):
+    if len(commits) != num_commits:
+        print(f'Expected {num_commits} commit(s), got {len(commits)}. Exiting.')
+        sys.exit(1)
+    if not start or not end:
+        print('--start and --end are required. Exiting.')
+        sys.exit(1)
+
+    try:
+        return (sb.history.ReportHistory(data_dir),
+                pd.period_range(start=start, end=end, freq=freq))
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        sys.exit(1)
+
+def _print_cache_stats(history):
+    print(f'[history] {history.hits} cached, {history.misses} computed', file=sys.stderr)
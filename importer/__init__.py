@@ -1,5 +1,7 @@
 from .importer import Importer
+from .plugin import load_parser_plugin
 
 __all__ = [
     Importer,
+    load_parser_plugin,
 ]
\ No newline at end of file
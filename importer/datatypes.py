@@ -1,9 +1,18 @@
+from core.amounts import format_units, to_units
 from dataclasses import dataclass
 from datetime import datetime
 import dataclasses
 import dateutil.parser
+import functools
 import re
 
+# sort key that moves edit and duplicate entries to the top of a pending
+# file, over items whose input type is `input_type(item)`. the comparator
+# isn't a consistent ordering, so both parsers sort with this same key to
+# write entries in the same order
+def pending_sort_key(input_type):
+    return functools.cmp_to_key(lambda a, b: -1 if input_type(a) in ['edit', 'duplicate'] else 0)
+
 @dataclass
 class JournalEntry:
     id: int = None
@@ -40,6 +49,17 @@ class JournalEntry:
 
     @staticmethod
     def _from_csv_row(row):
+        return JournalEntry(id=int(row[0]),
+                            source_file=row[1],
+                            source_file_line=row[2],
+                            input_type=row[3],
+                            date=dateutil.parser.parse(row[4]),
+                            description=row[5],
+                            splits=[Split.from_csv_row(vals) for vals in JournalEntry.split_values(row)])
+
+    # the raw (str) values of each split of a csv row
+    @staticmethod
+    def split_values(row):
         num_je_cols = 6
         num_split_cols = 4
         num_splits = int(len(row[num_je_cols:]) / num_split_cols)
@@ -47,28 +67,30 @@ class JournalEntry:
         # after the JE columns, determine number of splits by dividing the remaining
         # number of columns by the number of cols used to represent a split
         split_vals = [row[num_je_cols:][(i * num_split_cols):((i + 1) * num_split_cols)] for i in range(num_splits)]
-        splits = [Split(account_id=parse_number(vals[0], int),
-                        account_name=vals[1],
-                        action=vals[2],
-                        amount=parse_number(vals[3], float)) for vals in split_vals]
 
-        return JournalEntry(id=int(row[0]),
-                            source_file=row[1],
-                            source_file_line=row[2],
-                            input_type=row[3],
-                            date=dateutil.parser.parse(row[4]),
-                            description=row[5],
-                            splits=splits)
+        # files written from columns pad entries with fewer splits than the
+        # widest entry with empty trailing splits
+        while split_vals and not any(split_vals[-1]):
+            split_vals.pop()
+
+        return split_vals
 
 @dataclass
 class Split:
     account_id: int = None
     account_name: str = None
     action: str = None
-    amount: float = None
+    amount: int = None  # integer units, see core.amounts
 
     def to_csv_row(self):
-        return [self.account_id, self.account_name, self.action, self.amount]
+        return [self.account_id, self.account_name, self.action, format_units(self.amount)]
+
+    @staticmethod
+    def from_csv_row(vals):
+        return Split(account_id=parse_number(vals[0], int),
+                     account_name=vals[1],
+                     action=vals[2],
+                     amount=parse_amount(vals[3]))
 
 @dataclass
 class Metadata:
@@ -93,3 +115,7 @@ def parse_number(val, func):
         return func(val)
     except ValueError:
         return None
+
+# like `parse_number`, but returns an amount in integer units (core.amounts)
+def parse_amount(val):
+    return to_units(re.sub(r'[^\d.]', '', val) if type(val) is str else val)
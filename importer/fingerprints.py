@@ -0,0 +1,87 @@
+from .storage import JsonIndexManager, read_json_index
+from datetime import datetime
+import dateutil.parser
+import re
+
+# Fingerprints of every posted journal entry, used to flag likely duplicates
+# (e.g. from overlapping statement downloads) when new files are imported.
+#
+# An entry's fingerprints are one key per split,
+#
+#   date|normalized description|amount|account name
+#
+# plus one wildcard key with an empty account and the entry's total debit
+# amount, which is what entries that aren't matched to accounts yet (edits)
+# are checked against.
+#
+# The index is stored per posted file as {file: {key: [entry ids]}} so that
+# a post only has to redo the files that changed. The key -> files lookup
+# used during import is built from that on load.
+
+class FingerprintIndex:
+    def __init__(self, files=None):
+        self.files = files or {}
+        self.lookup = {}
+        for file, keys in self.files.items():
+            for key in keys:
+                self.lookup.setdefault(key, set()).add(file)
+
+    # matches against `file` itself are ignored, so reimporting a file
+    # doesn't flag every entry in it
+    def is_duplicate(self, keys, file):
+        return any(self.lookup.get(key, set()) - {file} for key in keys)
+
+    # entries from files imported earlier in the same run count as well
+    def add(self, keys, file):
+        for key in keys:
+            self.lookup.setdefault(key, set()).add(file)
+
+    def set_file(self, file, keys_by_id):
+        keys = {}
+        for id, entry_keys in keys_by_id.items():
+            for key in entry_keys:
+                keys.setdefault(key, []).append(id)
+        self.files[file] = keys
+
+    # every group of two or more entries sharing a wildcard key, in one pass
+    # over the index
+    def duplicate_groups(self):
+        entries_by_key = {}
+        for file, keys in sorted(self.files.items()):
+            for key, ids in keys.items():
+                if key.endswith('|'):
+                    entries_by_key.setdefault(key, []).extend((file, id) for id in ids)
+        return {key: entries for key, entries in entries_by_key.items() if len(entries) > 1}
+
+    def to_dict(self):
+        return {'files': self.files}
+
+class FingerprintManager(JsonIndexManager):
+    def __init__(self, index_file):
+        super().__init__(index_file, FingerprintIndex)
+
+# for read-only use, e.g. during import
+def read_index(index_file):
+    return read_json_index(index_file, FingerprintIndex)
+
+# `splits` are (account_name, action, amount) tuples, with amounts as
+# decimal strings (see core.amounts.format_units) and an empty account name
+# where the split has no account yet
+def entry_keys(date, description, splits, total):
+    prefix = f'{normalize_date(date)}|{normalize_description(description)}|'
+    return ([f'{prefix}{amount}|{account}' for account, _, amount in splits if account] +
+            [f'{prefix}{total}|'])
+
+# keys to look up for a newly imported entry: its accounted splits if it has
+# any, else the wildcard key
+def lookup_keys(keys):
+    accounted = [key for key in keys if not key.endswith('|')]
+    return accounted or keys[-1:]
+
+def normalize_date(date):
+    if not isinstance(date, datetime):
+        date = dateutil.parser.parse(str(date))
+    return date.date().isoformat()
+
+def normalize_description(description):
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', str(description).lower()).split())
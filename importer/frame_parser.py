@@ -0,0 +1,208 @@
+from .datatypes import JournalEntry, pending_sort_key
+from core.amounts import AMOUNT_PLACES, AMOUNT_SCALE
+from decimal import Decimal
+from pathlib import Path
+import csv
+import numpy as np
+import pandas as pd
+
+# DataFrame counterpart to BasicMatcherParser for very large source files.
+# Takes the same config shape, except that the `col_map` functions are
+# applied to the whole frame of data rows (columns are numbered from 0, all
+# values are str) and return a Series:
+#
+#   'col_map': {
+#       'date': lambda df: df[0],
+#       'description': lambda df: df[1],
+#       'amount': lambda df: df[2].str.replace(r'[^\d.]', '', regex=True).astype(float),
+#   }
+#
+# Matcher rules are applied column-wise, the first matching rule wins just
+# like in BasicMatcherParser, and the pending file is written straight from
+# the resulting columns without building a JournalEntry per row.
+
+SPLIT_FIELDS = ['account_id', 'account_name', 'account_action', 'amount']
+
+class FrameMatcherParser:
+    def read_frame(self, source_file):
+        return pd.read_csv(source_file, skiprows=2, header=None, dtype=str, keep_default_na=False)
+
+    def parse_frame(self, df, config):
+        col_map = config['col_map']
+        rules = config['matcher_rules']
+        num_rows = len(df)
+
+        # rounding to a few places first absorbs float error, so that e.g.
+        # 2.675 rounds half to even at 267.5 units like core.amounts.to_units
+        amounts = np.round(pd.to_numeric(col_map['amount'](df), errors='coerce').values * AMOUNT_SCALE, 6)
+        has_amount = ~np.isnan(amounts)
+        units = np.where(has_amount, np.round(amounts), 0).astype('int64')
+        formatted = np.where(has_amount, _format_units(units), '')
+
+        # index of the first matching rule per row, -1 where none match
+        matched = np.full(num_rows, -1)
+        for i, rule in enumerate(rules):
+            unmatched = np.flatnonzero(matched == -1)
+            is_match = df[rule['col']].iloc[unmatched].str.contains(rule['regex'], regex=True, na=False).values
+            matched[unmatched[is_match]] = i
+
+        num_splits = max([2] + [len(r['splits']) for r in rules if isinstance(r['splits'], list)])
+        splits = [{field: np.full(num_rows, '', dtype=object) for field in SPLIT_FIELDS}
+                  for _ in range(num_splits)]
+        input_type = np.full(num_rows, 'edit', dtype=object)
+
+        # unmatched rows become edit entries with no accounts
+        for split, action in zip(splits, ['debit', 'credit']):
+            split['account_action'][:] = action
+            split['amount'][:] = formatted
+
+        for i, rule in enumerate(rules):
+            rows = matched == i
+            if not rows.any() or not rule['splits']:
+                continue
+
+            input_type[rows] = 'auto'
+            if type(rule['splits']) is tuple:
+                key = 'account_id' if (type(rule['splits'][0]) is int) else 'account_name'
+                for split, account in zip(splits, rule['splits']):
+                    split[key][rows] = str(account)
+            else:
+                for split in splits:
+                    for field in SPLIT_FIELDS:
+                        split[field][rows] = ''
+                for split, part in zip(splits, _allocate_rule_splits(units[rows], rule['splits'])):
+                    for key in ['account_id', 'account_name']:
+                        if key in part['spec']:
+                            split[key][rows] = str(part['spec'][key])
+                    split['account_action'][rows] = part['spec']['action']
+                    split['amount'][rows] = np.where(has_amount[rows], _format_units(part['units']), '')
+
+        ignored = np.isin(matched, [i for i, r in enumerate(rules) if 'ignore' in r])
+        columns = {'source_file_line': np.arange(num_rows),
+                   'input_type': input_type,
+                   'date': col_map['date'](df).values,
+                   'description': col_map['description'](df).values}
+        for n, split in enumerate(splits):
+            columns.update({f'split_{n}_{field}': values for field, values in split.items()})
+
+        return pd.DataFrame(columns)[~ignored].reset_index(drop=True)
+
+    # ids are assigned in source order starting at `start_id`, then edit and
+    # duplicate entries are moved to the top of the file. the layout is that
+    # of JournalEntry.to_csv: the header names two splits, and each row ends
+    # after its last split
+    def write_pending(self, entries, file, source_file, start_id):
+        num_splits = len([c for c in entries.columns if c.endswith('_account_action')])
+        input_types = entries['input_type'].tolist()
+        order = sorted(range(len(entries)), key=pending_sort_key(input_types.__getitem__))
+
+        # splits per row, up to the last one with any value
+        has_split = np.column_stack([(entries[[f'split_{n}_{field}' for field in SPLIT_FIELDS]] != '').any(axis=1).values
+                                     for n in range(num_splits)] or [np.zeros(len(entries), dtype=bool)])
+        row_splits = np.where(has_split.any(axis=1), num_splits - np.argmax(has_split[:, ::-1], axis=1), 0)
+        row_lengths = (6 + 4 * row_splits)[order].tolist()
+
+        output = (entries
+                  .assign(id=np.arange(start_id, start_id + len(entries)))
+                  .assign(source_file=str(source_file))
+                  .pipe(lambda df: df[['id', 'source_file', 'source_file_line', 'input_type', 'date', 'description'] +
+                                      [f'split_{n}_{field}' for n in range(num_splits) for field in SPLIT_FIELDS]])
+                  .iloc[order]
+                  .values
+                  .tolist())
+
+        Path.mkdir(file.parent, parents=True, exist_ok=True)
+        with open(file, 'w') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerows(JournalEntry.to_csv([]))
+            writer.writerows(row[:length] for row, length in zip(output, row_lengths))
+
+    # replaces the splits of entries whose `edit_key` (date, description,
+    # first two split amounts) is in `prior_edits` with its raw split values,
+    # adding split columns if needed. returns a boolean array of the merged
+    # entries
+    def merge_edits(self, entries, prior_edits, edit_key):
+        keys = zip(entries['date'], entries['description'], entries['split_0_amount'], entries['split_1_amount'])
+        matches = [prior_edits.get(edit_key(*key)) for key in keys]
+        merged = np.array([m is not None for m in matches], dtype=bool)
+        if not merged.any():
+            return merged
+
+        rows = np.flatnonzero(merged)
+        num_splits = max(len(matches[row]) for row in rows)
+        for n in range(len([c for c in entries.columns if c.endswith('_account_action')]), num_splits):
+            for field in SPLIT_FIELDS:
+                entries[f'split_{n}_{field}'] = ''
+
+        empty_split = [''] * len(SPLIT_FIELDS)
+        for n in range(len([c for c in entries.columns if c.endswith('_account_action')])):
+            splits = [matches[row][n] if n < len(matches[row]) else empty_split for row in rows]
+            for field, split_values in zip(SPLIT_FIELDS, zip(*splits)):
+                values = entries[f'split_{n}_{field}'].values.copy()
+                values[rows] = split_values
+                entries[f'split_{n}_{field}'] = values
+        return merged
+
+    # fingerprint keys per entry, the same as importer.fingerprints.entry_keys
+    def entry_keys(self, entries, account_names):
+        prefix = (pd.to_datetime(entries['date']).dt.strftime('%Y-%m-%d') + '|' +
+                  entries['description'].str.lower().str.replace(r'[^0-9a-z]+', ' ', regex=True).str.split().str.join(' ') + '|')
+
+        num_splits = len([c for c in entries.columns if c.endswith('_account_action')])
+        split_keys = []
+        total = np.zeros(len(entries), dtype='int64')
+        for n in range(num_splits):
+            account = entries[f'split_{n}_account_name'].where(
+                entries[f'split_{n}_account_name'] != '',
+                entries[f'split_{n}_account_id'].map(lambda id: account_names.get(int(id), '') if id else ''))
+            amount = entries[f'split_{n}_amount']
+            split_keys.append((prefix + amount + '|' + account).where(account != '', None).tolist())
+
+            is_debit = (entries[f'split_{n}_account_action'] == 'debit') & (amount != '')
+            total += np.where(is_debit, np.round(pd.to_numeric(amount.where(is_debit, '0')).values * AMOUNT_SCALE), 0).astype('int64')
+
+        wildcard_keys = (prefix + _format_units(total) + '|').tolist()
+        return [[key for key in keys if key is not None] + [wildcard]
+                for *keys, wildcard in zip(*split_keys, wildcard_keys)]
+
+# core.amounts.format_units over an array. each distinct value is only
+# formatted once
+def _format_units(units):
+    distinct, inverse = np.unique(units, return_inverse=True)
+    whole, frac = np.divmod(np.abs(distinct), AMOUNT_SCALE)
+    sign = np.where(distinct < 0, '-', '')
+    if AMOUNT_PLACES == 0:
+        text = [f'{s}{w}' for s, w in zip(sign.tolist(), whole.tolist())]
+    else:
+        text = [f'{s}{w}.{f:0{AMOUNT_PLACES}d}' for s, w, f in zip(sign.tolist(), whole.tolist(), frac.tolist())]
+    return np.array(text, dtype=object)[inverse]
+
+# vectorized core.amounts.allocate, applied per action so that debits and
+# credits each sum to exactly the same number of units. percentages are
+# scaled to integers so the arithmetic is exact
+def _allocate_rule_splits(units, rule_splits):
+    parts = [{'spec': split} for split in rule_splits]
+
+    for action in {split['action'] for split in rule_splits}:
+        group = [part for part in parts if part['spec']['action'] == action]
+        percentages = [Decimal(repr(p) if isinstance(p, float) else p)
+                       for p in [part['spec']['percentage'] for part in group]]
+        places = max(0, *[-p.as_tuple().exponent for p in percentages])
+        scaled = [int(p.scaleb(places)) for p in percentages]
+        denominator = 100 * 10**places
+
+        shares = np.outer(units, scaled)
+        floors, remainders = np.divmod(shares, denominator)
+
+        # target total rounds half to even, like Decimal
+        quotient, remainder = np.divmod(units * sum(scaled), denominator)
+        target = quotient + ((2 * remainder > denominator) |
+                             ((2 * remainder == denominator) & (quotient % 2 == 1)))
+
+        # hand out the leftover units by largest remainder, earlier splits first on ties
+        ranks = np.argsort(np.argsort(-remainders, axis=1, kind='stable'), axis=1, kind='stable')
+        extra = (target - floors.sum(axis=1))[:, None]
+        for part, allocated in zip(group, (floors + (ranks < extra)).T):
+            part['units'] = allocated
+
+    return parts
@@ -1,9 +1,20 @@
-from .datatypes import JournalEntry, Metadata
-from core.data import CHART_OF_ACCOUNTS_PATH, MASTER_JOURNAL_PATH, METADATA_PATH
+from .datatypes import JournalEntry, Metadata, Split, parse_amount, pending_sort_key
+from .fingerprints import FingerprintManager, entry_keys, lookup_keys, normalize_date, read_index as read_fingerprints
+from .manifest import ManifestManager
+from .plugin import load_parser_plugin
+from .storage import FileLock, atomic_write
+from .suggestions import SUGGESTION_THRESHOLD, SuggestionManager, read_index as read_suggestions
+from concurrent.futures import ProcessPoolExecutor
+from core.amounts import format_units
+from core.paths import (CHART_OF_ACCOUNTS_PATH, FINGERPRINTS_PATH, MANIFEST_PATH, MASTER_JOURNAL_DIR, MASTER_JOURNAL_PATH, METADATA_PATH,
+                        OPENING_BALANCES_PATH, SUGGESTIONS_PATH, is_journal_partitioned, journal_partition_files, master_journal_files)
+from core.profiling import stage
 from pathlib import Path
+from types import SimpleNamespace
 import csv
 import functools
 import importer.transaction_file_parser
+import os
 import re
 import sys
 import yaml
@@ -14,12 +25,20 @@ class Importer:
 
         self.coa_file = data_dir / CHART_OF_ACCOUNTS_PATH
         self.mj_file = data_dir / MASTER_JOURNAL_PATH
+        self.mj_dir = data_dir / MASTER_JOURNAL_DIR
+        self.opening_balances_file = data_dir / OPENING_BALANCES_PATH
         self.md_file = data_dir / METADATA_PATH
+        self.manifest_file = data_dir / MANIFEST_PATH
+        self.fingerprints_file = data_dir / FINGERPRINTS_PATH
+        self.suggestions_file = data_dir / SUGGESTIONS_PATH
+
+        self.data_dir = data_dir
 
         self.source_dir = data_dir / 'source'
         self.preprocessed_dir = data_dir / 'preprocessed'
         self.pending_dir = data_dir / 'pending'
         self.posted_dir = data_dir / 'posted'
+        self.suggested_dir = data_dir / 'suggested'
 
         self.parsers = importer.transaction_file_parser.BUILTIN_PARSERS
         self.parsers.update(parser_plugin.parsers)
@@ -36,89 +55,455 @@ class Importer:
         self.coa_name_to_id = {a['name']: int(a['id']) for a in self.chart_of_accounts}
 
     def import_transactions(self, files_arg=None):
-        with MetadataManager(self.md_file) as metadata:
+        with MetadataManager(self.md_file) as metadata, ManifestManager(self.manifest_file) as manifest:
 
             if list(self.pending_dir.glob('**/*')):
                 print('/pending dir must be empty before starting new import. Exiting.')
                 sys.exit(1)
 
+            sources = manifest.refresh('source', self.source_dir)
+            already_imported = set(metadata.get_all_imported_files())
+
+            # the first scan of a file that was imported before the manifest
+            # existed adopts its current contents as the imported version
+            for file in already_imported & set(sources):
+                sources[file].setdefault('imported_sha256', sources[file]['sha256'])
+
+            modified = sorted(f for f in already_imported & set(sources)
+                              if sources[f]['imported_sha256'] != sources[f]['sha256'])
+            if modified:
+                print('Source files modified since they were imported (use `reimport` to pick up changes):')
+                for file in modified:
+                    print(f'\t- {file}')
+
             files_to_import = []
             if files_arg is not None:
                 files = [Path(f) for f in files_arg]
                 files_to_import = sorted([f for f in files if (self.source_dir / f).is_file()])
             else:
-                source_dir_files = [f.relative_to(self.source_dir) for f in self.source_dir.glob('**/*') if f.is_file()]
-                already_imported = [Path(f) for f in metadata.get_all_imported_files()]
-                files_to_import = sorted(list(set(source_dir_files) - set(already_imported)))
+                files_to_import = sorted([Path(f) for f in sources if f not in already_imported])
 
             if not files_to_import:
                 print('No files to import. Exiting.')
                 sys.exit(1)
 
+            fingerprints = read_fingerprints(self.fingerprints_file)
+            suggestions = read_suggestions(self.suggestions_file)
+
             print('Importing files:')
             start_tx_id = metadata.tx_id_counter
             for source_file in files_to_import:
+                parser, config = self._parser_for(source_file)
 
-                source_file_rows = self._read_csv(self.source_dir / source_file)
-                [_, parser_name, parser_config_id] = source_file_rows[0][0].split(':')
-                data_rows = source_file_rows[2:]
+                # DataFrame-mode parsers read, parse and write whole columns
+                if hasattr(parser, 'parse_frame'):
+                    entries = self._parse_frame(parser, config, source_file)
+                    start_tx_id += self._stage_frame(parser, config, source_file, entries, start_tx_id, fingerprints, suggestions)
+                else:
+                    entries = self._parse_rows(parser, config, source_file)
+                    start_tx_id += self._stage_entries(config, source_file, entries, start_tx_id, fingerprints, suggestions)
+                sources[source_file.as_posix()]['imported_sha256'] = sources[source_file.as_posix()]['sha256']
 
-                parser = self.parsers[parser_name]()
-                config = self.parser_configs[parser_name][parser_config_id] if parser_name in self.parser_configs else None
-                entries = parser.parse(data_rows, config)
+                print(f'\t- imported {source_file}')
 
-                for id, entry in enumerate(entries, start_tx_id):
-                    entry.source_file = source_file
-                    entry.id = id
-                start_tx_id += len(entries)
+            print('Import succeeded. Imported files have been staged to /pending')
 
-                entries.sort(key=functools.cmp_to_key(lambda a, b: -1 if a.input_type == 'edit' else 0))
-                output = JournalEntry.to_csv(entries)
-                self._write_csv(output, self.pending_dir / source_file)
+    # reimports source files (by default every imported file) keeping the
+    # accounts of edit entries from their posted versions - in one pass
+    # rather than reimport, gen-mergefiles and merge-edits
+    #
+    # files are read, parsed and merged with their prior edits in a pool of
+    # worker processes. ids, duplicate flags and suggestions depend on the
+    # files before them, so those are done afterwards, in file order
+    def reimport_merge(self, files_arg=None, max_workers=None):
+        with MetadataManager(self.md_file) as metadata, ManifestManager(self.manifest_file) as manifest:
 
-                print(f'\t- imported {source_file}')
+            if list(self.pending_dir.glob('**/*')):
+                print('/pending dir must be empty before starting new import. Exiting.')
+                sys.exit(1)
 
-            print('Import succeeded. Imported files have been staged to /pending')
+            sources = manifest.refresh('source', self.source_dir)
+            if files_arg:
+                files_to_import = sorted([Path(f) for f in files_arg if (self.source_dir / f).is_file()])
+            else:
+                files_to_import = sorted([Path(f) for f in set(metadata.get_all_imported_files()) & set(sources)])
+
+            if not files_to_import:
+                print('No files to reimport. Exiting.')
+                sys.exit(1)
+
+            fingerprints = read_fingerprints(self.fingerprints_file)
+            suggestions = read_suggestions(self.suggestions_file)
+
+            print(f'Reimporting {len(files_to_import)} files with preserved edits:')
+            with stage('reimport.parse') as s:
+                if len(files_to_import) == 1 or max_workers == 1:
+                    parsed = [self._parse_with_prior_edits(f) for f in files_to_import]
+                else:
+                    with ProcessPoolExecutor(max_workers=max_workers or min(len(files_to_import), os.cpu_count() or 1),
+                                             initializer=_init_reimport_worker,
+                                             initargs=(self.data_dir,)) as pool:
+                        parsed = list(pool.map(_reimport_worker, files_to_import))
+                s.rows = sum(len(entries) for entries, _ in parsed)
+
+            start_tx_id = metadata.tx_id_counter
+            for source_file, (entries, merged) in zip(files_to_import, parsed):
+                parser, config = self._parser_for(source_file)
+                if hasattr(parser, 'parse_frame'):
+                    start_tx_id += self._stage_frame(parser, config, source_file, entries, start_tx_id,
+                                                     fingerprints, suggestions, merged)
+                else:
+                    start_tx_id += self._stage_entries(config, source_file, entries, start_tx_id,
+                                                       fingerprints, suggestions, merged)
+                sources[source_file.as_posix()]['imported_sha256'] = sources[source_file.as_posix()]['sha256']
+
+                print(f'\t- reimported {source_file}, kept {sum(merged)} edited entries')
+
+            print('Reimport succeeded. Reimported files have been staged to /pending')
+
+    def _parser_for(self, source_file):
+        [_, parser_name, parser_config_id] = self._read_csv_header(self.source_dir / source_file)[0].split(':')
+        parser = self.parsers[parser_name]()
+        config = self.parser_configs[parser_name][parser_config_id] if parser_name in self.parser_configs else None
+        return parser, config
+
+    def _parse_rows(self, parser, config, source_file):
+        with stage('import.read') as s:
+            source_file_rows = self._read_csv(self.source_dir / source_file)
+            s.rows = len(source_file_rows)
+        data_rows = source_file_rows[2:]
+
+        with stage('import.parse') as s:
+            entries = parser.parse(data_rows, config)
+            s.rows = len(entries)
+        return entries
+
+    def _parse_frame(self, parser, config, source_file):
+        with stage('import.read') as s:
+            data = parser.read_frame(self.source_dir / source_file)
+            s.rows = len(data)
+
+        with stage('import.parse') as s:
+            entries = parser.parse_frame(data, config)
+            s.rows = len(entries)
+        return entries
+
+    # (entries, merged) where `merged` flags the entries that took their
+    # splits from a matching edit entry (same date, description and first
+    # two split amounts) in the posted version of the file
+    def _parse_with_prior_edits(self, source_file):
+        parser, config = self._parser_for(source_file)
+        prior_edits = self._prior_edits(source_file)
+
+        if hasattr(parser, 'parse_frame'):
+            entries = self._parse_frame(parser, config, source_file)
+            return entries, parser.merge_edits(entries, prior_edits, _edit_key)
+
+        entries = self._parse_rows(parser, config, source_file)
+        merged = [False] * len(entries)
+        for i, entry in enumerate(entries):
+            if len(entry.splits) < 2:
+                continue
+            splits = prior_edits.get(_edit_key(entry.date, entry.description,
+                                               format_units(entry.splits[0].amount),
+                                               format_units(entry.splits[1].amount)))
+            if splits:
+                entry.splits = [Split.from_csv_row(vals) for vals in splits]
+                merged[i] = True
+        return entries, merged
+
+    # {edit key: split values} for the edit entries of the posted file
+    def _prior_edits(self, source_file):
+        posted_file = self.posted_dir / source_file
+        if not posted_file.is_file():
+            return {}
+
+        prior_edits = {}
+        for row in self._read_csv(posted_file)[1:]:
+            if row[3] != 'edit':
+                continue
+            splits = [vals[:3] + [_normalize_amount(vals[3]) or ''] for vals in JournalEntry.split_values(row)]
+            if len(splits) >= 2:
+                prior_edits[_edit_key(row[4], row[5], splits[0][3], splits[1][3])] = splits
+        return prior_edits
+
+    # ids are assigned from `start_tx_id` in source order, returns the number
+    # of entries. `merged` entries already have accounts, they aren't given
+    # suggestions
+    def _stage_entries(self, config, source_file, entries, start_tx_id, fingerprints, suggestions, merged=None):
+        for id, entry in enumerate(entries, start_tx_id):
+            entry.source_file = source_file
+            entry.id = id
+
+        duplicates = self._find_duplicates(fingerprints, [self._entry_keys(e) for e in entries], source_file)
+        for entry, is_duplicate in zip(entries, duplicates):
+            if is_duplicate:
+                entry.input_type = 'duplicate'
+        if any(duplicates):
+            print(f'\t  flagged {sum(duplicates)} likely duplicate entries in {source_file} (input_type: duplicate)')
+
+        edits = [e for i, e in enumerate(entries) if e.input_type == 'edit' and not (merged and merged[i])]
+        for entry, (debit, credit) in zip(edits, self._suggest_accounts(suggestions, config, source_file, edits)):
+            if debit:
+                entry.splits[0].account_name = debit
+                entry.splits[1].account_name = credit
+
+        with stage('import.write') as s:
+            entries.sort(key=pending_sort_key(lambda e: e.input_type))
+            output = JournalEntry.to_csv(entries)
+            self._write_csv(output, self.pending_dir / source_file)
+            s.rows = len(output)
+
+        return len(entries)
+
+    def _stage_frame(self, parser, config, source_file, entries, start_tx_id, fingerprints, suggestions, merged=None):
+        duplicates = self._find_duplicates(fingerprints, parser.entry_keys(entries, self.coa_id_to_name), source_file)
+        entries.loc[duplicates, 'input_type'] = 'duplicate'
+        if any(duplicates):
+            print(f'\t  flagged {sum(duplicates)} likely duplicate entries in {source_file} (input_type: duplicate)')
+
+        is_edit = (entries['input_type'] == 'edit').values
+        edits = entries[(is_edit & ~merged) if merged is not None else is_edit]
+        suggested = self._suggest_accounts(suggestions, config, source_file,
+                                           [SimpleNamespace(description=d, source_file_line=l)
+                                            for d, l in zip(edits['description'], edits['source_file_line'])])
+        for row, (debit, credit) in zip(edits.index, suggested):
+            if debit:
+                entries.at[row, 'split_0_account_name'] = debit
+                entries.at[row, 'split_1_account_name'] = credit
+
+        with stage('import.write') as s:
+            parser.write_pending(entries, self.pending_dir / source_file, source_file, start_tx_id)
+            s.rows = len(entries)
+
+        return len(entries)
+
+    # checks each entry against the posted entries and the files imported
+    # earlier in this run - a dict lookup per fingerprint
+    def _find_duplicates(self, fingerprints, keys_per_entry, source_file):
+        with stage('import.dedupe') as s:
+            duplicates = [fingerprints.is_duplicate(lookup_keys(keys), source_file.as_posix())
+                          for keys in keys_per_entry]
+            for keys in keys_per_entry:
+                fingerprints.add(keys, source_file.as_posix())
+            s.rows = len(duplicates)
+        return duplicates
+
+    # (debit, credit) account names per edit entry, (None, None) where there
+    # is no suggestion above the threshold. the suggestions made, with their
+    # confidence, are listed in /suggested under the source file's name
+    def _suggest_accounts(self, suggestions, config, source_file, edits):
+        threshold = (config or {}).get('suggestion_threshold', SUGGESTION_THRESHOLD)
+        suggested = []
+        log = [['source_file_line', 'description', 'debit_account_name', 'credit_account_name', 'confidence']]
+        with stage('import.suggest') as s:
+            for entry in edits:
+                suggestion = suggestions.suggest(entry.description)
+                if suggestion and suggestion[2] >= threshold:
+                    debit, credit, confidence = suggestion
+                    suggested.append((debit, credit))
+                    log.append([entry.source_file_line, entry.description, debit, credit, f'{confidence:.2f}'])
+                else:
+                    suggested.append((None, None))
+            s.rows = len(edits)
+
+        log_file = self.suggested_dir / source_file
+        if len(log) > 1:
+            self._write_csv(log, log_file)
+            print(f'\t  suggested accounts for {len(log) - 1} edit entries in {source_file} '
+                  f'(see {log_file.relative_to(self.data_dir)})')
+        elif log_file.is_file():
+            log_file.unlink()
+        return suggested
+
+    def _entry_keys(self, entry):
+        splits = [(split.account_name or self.coa_id_to_name.get(split.account_id, ''),
+                   split.action,
+                   format_units(split.amount)) for split in entry.splits]
+        total = sum(split.amount or 0 for split in entry.splits if split.action == 'debit')
+        return entry_keys(entry.date, entry.description, splits, format_units(total))
 
     def post_to_journal(self):
-        with MetadataManager(self.md_file) as metadata:
+        with MetadataManager(self.md_file) as metadata, ManifestManager(self.manifest_file) as manifest:
             pending_files = [f.relative_to(self.pending_dir) for f in self.pending_dir.glob('**/*') if f.is_file()]
             if not pending_files:
                 print('Post failed, no pending import run found. Exiting.')
                 sys.exit(1)
 
+            # every pending file is validated before any is written, so a bad
+            # entry doesn't leave /posted ahead of the metadata and journal
+            entries_by_pending_file = {}
+            for file in pending_files:
+                with stage('post.read') as s:
+                    input_entries = JournalEntry.from_csv(self._read_csv(self.pending_dir / file))
+                    s.rows = len(input_entries)
+                with stage('post.validate') as s:
+                    entries_by_pending_file[file] = self._post_entries(input_entries)
+                    s.rows = len(entries_by_pending_file[file])
+
             print(f'Post pending files:')
             num_entries_posted = 0
-            for file in pending_files:
-                input_entries = JournalEntry.from_csv(self._read_csv(self.pending_dir / file))
-                output_entries = self._post_entries(input_entries)
+            for file, output_entries in entries_by_pending_file.items():
                 num_entries_posted += len(output_entries)
 
-                output_rows = JournalEntry.to_csv(output_entries)
-                self._write_csv(output_rows, (self.posted_dir / file))
+                with stage('post.write') as s:
+                    output_rows = JournalEntry.to_csv(output_entries)
+                    self._write_csv(output_rows, (self.posted_dir / file))
+                    s.rows = len(output_rows)
 
                 metadata.log_post(str(file), len(output_entries))
                 print(f'\t- {file}')
 
+            # posted files that haven't changed since the last rebuild were
+            # already validated against the same CoA, and their rows are
+            # still in the master journal - reuse those instead of re-parsing
+            posted = manifest.refresh('posted', self.posted_dir)
+            reusable_rows = self._reusable_journal_rows(manifest, posted)
+
             print(f'Validate posted journal entries from:')
+            output = [['id', 'date', 'description', 'account_id', 'account_name', 'action', 'amount']]
             all_journal_entries = []
-            for file in [f for f in self.posted_dir.glob('**/*') if f.is_file()]:
-                all_journal_entries += JournalEntry.from_csv(self._read_csv(file))
-                print(f'\t- {file}')
+            entries_by_file = {}
+            reused_ids = []
+            for file, record in posted.items():
+                if file in reusable_rows:
+                    ids, rows = reusable_rows[file]
+                    output += rows
+                    reused_ids += ids
+                    print(f'\t- {self.posted_dir / file} (unchanged)')
+                    continue
+
+                with stage('post.read') as s:
+                    entries = JournalEntry.from_csv(self._read_csv(self.posted_dir / file))
+                    s.rows = len(entries)
+                for entry in entries:
+                    for split in entry.splits:
+                        output.append([entry.id, entry.date, entry.description] + split.to_csv_row())
+
+                ids = [e.id for e in entries]
+                record['journal'] = {'sha256': record['sha256'],
+                                     'first_id': min(ids, default=0),
+                                     'last_id': max(ids, default=-1),
+                                     'num_entries': len(ids)}
+                all_journal_entries += entries
+                entries_by_file[file] = entries
+                print(f'\t- {self.posted_dir / file}')
+
+            with stage('post.validate') as s:
+                self._validate_journal(all_journal_entries, reused_ids)
+                s.rows = len(all_journal_entries) + len(reused_ids)
+
+            with stage('post.write') as s:
+                self._write_master_journal(output)
+                s.rows = len(output) - 1
+
+            self._update_indexes(posted, entries_by_file, reusable_rows)
+
+            master = manifest.refresh('master', self.data_dir, [self.coa_file] + master_journal_files(self.data_dir))
+            for record in master.values():
+                record['journal_sha256'] = record['sha256']
+
+            print(f'Post succeeded.')
+
+    # the fingerprint and suggestion indexes are kept per posted file, only
+    # files that changed (or are missing from an index) are redone
+    def _update_indexes(self, posted, entries_by_file, reusable_rows):
+        with FingerprintManager(self.fingerprints_file) as fingerprints, \
+             SuggestionManager(self.suggestions_file) as suggestions:
+
+            for index in [fingerprints, suggestions]:
+                for file in set(index.files) - set(posted):
+                    del index.files[file]
+
+            for file, entries in entries_by_file.items():
+                fingerprints.set_file(file, {e.id: self._entry_keys(e) for e in entries})
+                suggestions.set_file(file, entries)
+
+            for file, (_, rows) in reusable_rows.items():
+                if file not in fingerprints.files:
+                    fingerprints.set_file(file, self._journal_row_keys(rows))
+                # the master journal doesn't keep input types, read the posted file
+                if file not in suggestions.files:
+                    suggestions.set_file(file, JournalEntry.from_csv(self._read_csv(self.posted_dir / file)))
+
+    def _journal_row_keys(self, rows):
+        rows_by_id = {}
+        for row in rows:
+            rows_by_id.setdefault(int(row[0]), []).append(row)
+
+        # amounts are normalized, journals posted before amounts were kept in
+        # integer units hold floats (125.6 rather than 125.60)
+        return {id: entry_keys(rows[0][1], rows[0][2],
+                               [(row[4], row[5], format_units(parse_amount(row[6]))) for row in rows],
+                               format_units(sum(parse_amount(row[6]) for row in rows if row[5] == 'debit')))
+                for id, rows in rows_by_id.items()}
+
+    def _reusable_journal_rows(self, manifest, posted):
+        previous_files = set(manifest.sections.get('master', {}))
+        master = manifest.refresh('master', self.data_dir, [self.coa_file] + master_journal_files(self.data_dir))
+        if (set(master) != previous_files or
+            any(record.get('journal_sha256') != record['sha256'] for record in master.values())):
+            return {}
+
+        candidates = {file: record['journal'] for file, record in posted.items()
+                      if record.get('journal', {}).get('sha256') == record['sha256']}
+        if not candidates:
+            return {}
+
+        rows_by_id = {}
+        for file in master_journal_files(self.data_dir):
+            for row in self._read_csv(file)[1:]:
+                rows_by_id.setdefault(int(row[0]), []).append(row)
+
+        reusable = {}
+        for file, journal in candidates.items():
+            ids = [i for i in range(journal['first_id'], journal['last_id'] + 1) if i in rows_by_id]
+            if len(ids) == journal['num_entries']:
+                reusable[file] = (ids, [row for i in ids for row in rows_by_id[i]])
+        return reusable
+
+    # with the partitioned layout (see core.paths), rows are split into one
+    # file per year, and the per-account totals through the end of each year
+    # are written alongside so readers can skip everything before a window
+    def _write_master_journal(self, output):
+        if not is_journal_partitioned(self.data_dir):
+            self._write_csv(output, self.mj_file)
+            print(f'- wrote master journal file')
+            return
 
-            self._validate_journal(all_journal_entries)
+        header, rows = output[0], output[1:]
+        rows_by_year = {}
+        for row in rows:
+            rows_by_year.setdefault(int(str(row[1])[:4]), []).append(row)
 
-            output = [['id', 'date', 'description', 'account_id', 'account_name', 'action', 'amount']]
-            for entry in all_journal_entries:
-                for split in entry.splits:
-                    output.append([entry.id, entry.date, entry.description] + split.to_csv_row())
+        for file in journal_partition_files(self.data_dir):
+            if int(file.stem) not in rows_by_year:
+                file.unlink()
 
-            self._write_csv(output, self.mj_file)
+        totals = {}
+        opening_balances = [['year', 'account_id', 'account_name', 'action', 'amount']]
+        for year in range(min(rows_by_year, default=0), max(rows_by_year, default=-1) + 1):
+            year_rows = rows_by_year.get(year, [])
+            if year_rows:
+                self._write_csv([header] + year_rows, self.mj_dir / f'{year}.csv')
+
+            for row in year_rows:
+                key = (int(row[3]), row[4], row[5])
+                totals[key] = totals.get(key, 0) + parse_amount(row[6])
+            opening_balances += [[year, *key, format_units(units)] for key, units in sorted(totals.items())]
 
-            print(f'- wrote master journal file\nPost succeeded.')
+        self._write_csv(opening_balances, self.opening_balances_file)
+        print(f'- wrote master journal partitions for {len(rows_by_year)} years to {self.mj_dir}')
 
     def _post_entries(self, journal_entries):
 
+        # likely duplicates flagged at import have to be resolved by hand
+        for entry in journal_entries:
+            if entry.input_type == 'duplicate':
+                print(f'Likely duplicate of a posted entry: {entry}\n'
+                      f'Delete it, or change its input_type to post it anyway.\nExiting.')
+                sys.exit(1)
+
         # fetch any missing account_id's for the supplied account_name's,
         # and vise versa
         for entry in journal_entries:
@@ -150,7 +535,7 @@ class Importer:
 
         return journal_entries
 
-    def _validate_journal(self, journal_entries):
+    def _validate_journal(self, journal_entries, reused_ids=()):
         # validate that there are no duplicate CoA ids
         id_list = [int(account['id']) for account in self.chart_of_accounts]
         id_set = set(id_list)
@@ -166,17 +551,33 @@ class Importer:
                     sys.exit(1)
 
         # all entries have a unique id
-        all_ids = [e.id for e in journal_entries]
+        all_ids = [e.id for e in journal_entries] + list(reused_ids)
         if len(all_ids) != len(set(all_ids)):
             raise RuntimeError('One or more journal entries have overlapping or missing ids')
 
+    # groups of posted entries sharing date, description and amount, from
+    # the fingerprint index
+    def dedupe_report(self):
+        groups = read_fingerprints(self.fingerprints_file).duplicate_groups()
+
+        if not groups:
+            print('No likely duplicates found.')
+            return
+
+        print(f'Found {len(groups)} groups of likely duplicates (date|description|amount):')
+        for key, entries in sorted(groups.items()):
+            print(f'\t- {key[:-1]}')
+            for file, id in entries:
+                print(f'\t\t{file}: entry {id}')
+
     def generate_mergefiles(self, files_arg):
         files = [Path(f) for f in files_arg] if files_arg else self.source_dir.glob('**/*')
         input_files = [f.relative_to(self.source_dir) for f in files if f.is_file()]
 
         for file in input_files:
-            from_posted = [e for e in JournalEntry.from_csv(self._read_csv(self.posted_dir / file))
-                                   if e.input_type == 'edit']
+            # only edit rows are parsed
+            from_posted = JournalEntry.from_csv([row for i, row in enumerate(self._read_csv(self.posted_dir / file))
+                                                 if i == 0 or row[3] == 'edit'])
 
             for e in from_posted:
                 e.id = -1
@@ -223,27 +624,74 @@ class Importer:
         with open(file) as f:
             return list(csv.reader(f))
 
+    def _read_csv_header(self, file):
+        with open(file) as f:
+            return next(csv.reader(f))
+
     def _write_csv(self, rows, file):
         Path.mkdir(file.parent, parents=True, exist_ok=True)
         with open(file, 'w') as f:
             csv.writer(f, lineterminator='\n').writerows(rows)
 
+# reimport workers each load the parser plugin and build their own Importer
+# once, since plugin code can't be pickled
+_worker_importer = None
+
+def _init_reimport_worker(data_dir):
+    global _worker_importer
+    _worker_importer = Importer(data_dir=data_dir, parser_plugin=load_parser_plugin(data_dir))
+
+def _reimport_worker(source_file):
+    return _worker_importer._parse_with_prior_edits(source_file)
+
+# entries are matched to prior edits on date, description and the amounts of
+# their first two splits, as in `merge_edits`. amounts are decimal strings,
+# normalized since files posted before amounts were kept in integer units
+# hold floats (125.6 rather than 125.60)
+def _edit_key(date, description, amount_0, amount_1):
+    return (_normalize_date(date), description, _normalize_amount(amount_0), _normalize_amount(amount_1))
+
+# source files repeat the same few hundred dates, parse each one once
+@functools.lru_cache(maxsize=None)
+def _normalize_date(date):
+    return normalize_date(date)
+
+@functools.lru_cache(maxsize=None)
+def _normalize_amount(amount):
+    return format_units(parse_amount(amount))
+
+# the C loader/dumper (libyaml) is several times faster than the pure python
+# one, fall back to the latter where pyyaml was built without it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 class MetadataManager:
+
+    # the lock is held from __enter__ to __exit__, so concurrent commands
+    # serialize on the whole read-modify-write of `tx_id_counter`
     def __init__(self, md_file):
         self.md_file = md_file
+        self.lock = FileLock(str(md_file) + '.lock')
 
     def __enter__(self):
-        Path(self.md_file).touch()
-        with open(self.md_file, 'r') as f:
-            data = yaml.safe_load(f)
-            md = Metadata(**data) if data else Metadata(0, {})
-            self.metadata = md
-            return md
+        self.lock.acquire()
+        try:
+            Path(self.md_file).touch()
+            with open(self.md_file, 'r') as f:
+                data = yaml.load(f, Loader=YAML_LOADER)
+                md = Metadata(**data) if data else Metadata(0, {})
+                self.metadata = md
+                return md
+        except BaseException:
+            self.lock.release()
+            raise
 
     def __exit__(self, type, value, traceback):
-        if type is None and value is None and traceback is None:
-            with open(self.md_file, 'w') as f:
-                yaml.dump(self.metadata.to_dict(), f)
-        else:
-            return False
-
+        try:
+            if type is None and value is None and traceback is None:
+                with atomic_write(self.md_file) as f:
+                    yaml.dump(self.metadata.to_dict(), f, Dumper=YAML_DUMPER)
+            else:
+                return False
+        finally:
+            self.lock.release()
@@ -0,0 +1,59 @@
+from .storage import JsonIndexManager
+import hashlib
+import time
+
+# files modified within this window of being hashed are re-hashed on the
+# next scan, since a same-size write within the filesystem's mtime
+# granularity would otherwise go unnoticed
+RACY_WINDOW_NS = 2 * 10**9
+
+# A manifest records size, mtime and content hash for every file the
+# importer reads, grouped into sections ('source', 'posted', 'master').
+#
+# Scans are stat-only: a file is only re-hashed when its size or mtime no
+# longer match the manifest. Commands attach their own fields to a file's
+# record (e.g. the hash of a source file at import time) and those fields
+# are carried over when the file changes, so callers can compare them
+# against the current hash.
+
+class Manifest:
+    def __init__(self, sections=None):
+        self.sections = sections or {}
+
+    def refresh(self, section, root, files=None):
+        previous = self.sections.get(section, {})
+        current = {}
+
+        for f in (files if files is not None else root.glob('**/*')):
+            if not f.is_file():
+                continue
+
+            rel_path = f.relative_to(root).as_posix()
+            st = f.stat()
+            record = previous.get(rel_path, {})
+            if (record.get('size') != st.st_size or
+                record.get('mtime_ns') != st.st_mtime_ns or
+                st.st_mtime_ns >= record.get('checked_ns', 0) - RACY_WINDOW_NS):
+                record = {**record,
+                          'size': st.st_size,
+                          'mtime_ns': st.st_mtime_ns,
+                          'checked_ns': time.time_ns(),
+                          'sha256': file_hash(f)}
+            current[rel_path] = record
+
+        self.sections[section] = current
+        return current
+
+    def to_dict(self):
+        return {'sections': self.sections}
+
+class ManifestManager(JsonIndexManager):
+    def __init__(self, manifest_file):
+        super().__init__(manifest_file, Manifest, indent=1)
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,20 @@
+from core.paths import PARSER_PLUGIN_PATH
+import importlib.util
+
+# the user's parser plugin (user_code/parser_plugin.py), which defines a
+# `ParserPlugin` with `parsers` and `parser_configs`. loaded by the CLI, and
+# by each reimport worker process since plugin code can't be pickled
+def load_parser_plugin(data_dir):
+    parser_plugin_file = data_dir / PARSER_PLUGIN_PATH
+    parser_plugin = None
+    try:
+        spec = importlib.util.spec_from_file_location('parser_plugin', parser_plugin_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        parser_plugin = module.ParserPlugin()
+    except Exception as e:
+        print(f'Failed to load plugin from {parser_plugin_file}:')
+        print(e)
+        print('Continuing import with no user code.')
+
+    return parser_plugin
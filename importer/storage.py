@@ -0,0 +1,64 @@
+from core.storage import atomic_write
+from pathlib import Path
+import json
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on windows - commands run unlocked there
+    fcntl = None
+
+# Read-modify-write of a JSON index kept as one file: `index_class(**data)`
+# is loaded on enter, and its `to_dict()` written back atomically if the
+# block exits cleanly. A missing or empty file loads as `index_class()`.
+class JsonIndexManager:
+    def __init__(self, index_file, index_class, indent=None):
+        self.index_file = index_file
+        self.index_class = index_class
+        self.indent = indent
+
+    def __enter__(self):
+        self.index = read_json_index(self.index_file, self.index_class)
+        return self.index
+
+    def __exit__(self, type, value, traceback):
+        if type is None and value is None and traceback is None:
+            with atomic_write(self.index_file) as f:
+                json.dump(self.index.to_dict(), f, indent=self.indent, sort_keys=True)
+        else:
+            return False
+
+# for read-only use, e.g. during import
+def read_json_index(index_file, index_class):
+    data = None
+    if Path(index_file).is_file():
+        with open(index_file, 'r') as f:
+            data = json.load(f)
+    return index_class(**data) if data else index_class()
+
+# Exclusive advisory lock held on a separate lock file, since the file being
+# protected is replaced (and so changes inode) on every atomic write.
+class FileLock:
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.f = None
+
+    def acquire(self):
+        Path.mkdir(Path(self.lock_file).parent, parents=True, exist_ok=True)
+        self.f = open(self.lock_file, 'a')
+        if fcntl is None:
+            return
+
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f'Waiting for another slowbooks command to release {self.lock_file}', file=sys.stderr)
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+
+    def release(self):
+        if self.f is not None:
+            if fcntl is not None:
+                fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
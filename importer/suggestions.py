@@ -0,0 +1,98 @@
+from .fingerprints import normalize_description
+from .storage import JsonIndexManager, read_json_index
+import math
+
+# Suggested accounts for entries that no matcher rule picked up, learned
+# from how similar descriptions were classified in the posted history.
+#
+# Posted two-split entries that weren't matched by a rule ('edit' and
+# 'manual' entries) are indexed as
+#
+#   token -> {'debit account|credit account': count}
+#
+# where tokens are the words of the normalized description plus every pair
+# of adjacent words, leaving out words with digits (dates, store numbers,
+# references). A description's score for an account pair is the
+# idf-weighted share of its known tokens' history that went to that pair,
+# scaled by the fraction of its tokens that are known. The confidence is
+# 1.0 when every token was seen before, and only ever with one pair.
+#
+# Like the fingerprint index, the index is stored per posted file so a post
+# only redoes the files that changed.
+
+LEARN_INPUT_TYPES = ['edit', 'manual']
+
+# suggestions below this confidence are not filled in. parser configs can
+# override it with a 'suggestion_threshold' key
+SUGGESTION_THRESHOLD = 0.6
+
+class SuggestionIndex:
+    def __init__(self, files=None):
+        self.files = files or {}
+        self.tokens = {}
+        self.totals = {}
+        self.num_entries = 0
+        for index in self.files.values():
+            self._merge(index)
+
+    def set_file(self, file, entries):
+        index = {'entries': 0, 'tokens': {}}
+        for entry in entries:
+            signature = entry_signature(entry)
+            if entry.input_type not in LEARN_INPUT_TYPES or signature is None:
+                continue
+
+            index['entries'] += 1
+            for token in tokenize(entry.description):
+                counts = index['tokens'].setdefault(token, {})
+                counts[signature] = counts.get(signature, 0) + 1
+        self.files[file] = index
+
+    # (debit account, credit account, confidence), or None if no token of
+    # the description has been seen before
+    def suggest(self, description):
+        tokens = set(tokenize(description))
+        known = [token for token in tokens if token in self.tokens]
+        if not known:
+            return None
+
+        scores, total_weight = {}, 0.0
+        for token in known:
+            seen = self.totals[token]
+            weight = math.log(1 + self.num_entries / seen)
+            total_weight += weight
+            for signature, count in self.tokens[token].items():
+                scores[signature] = scores.get(signature, 0.0) + weight * count / seen
+
+        signature, score = max(scores.items(), key=lambda item: item[1])
+        debit, credit = signature.split('|')
+        return debit, credit, (score / total_weight) * (len(known) / len(tokens))
+
+    def to_dict(self):
+        return {'files': self.files}
+
+    def _merge(self, index):
+        self.num_entries += index['entries']
+        for token, counts in index['tokens'].items():
+            merged = self.tokens.setdefault(token, {})
+            for signature, count in counts.items():
+                merged[signature] = merged.get(signature, 0) + count
+                self.totals[token] = self.totals.get(token, 0) + count
+
+class SuggestionManager(JsonIndexManager):
+    def __init__(self, index_file):
+        super().__init__(index_file, SuggestionIndex)
+
+def read_index(index_file):
+    return read_json_index(index_file, SuggestionIndex)
+
+def tokenize(description):
+    words = [w for w in normalize_description(description).split() if not any(c.isdigit() for c in w)]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+def entry_signature(entry):
+    debits = [s for s in entry.splits if s.action == 'debit']
+    credits = [s for s in entry.splits if s.action == 'credit']
+    if len(debits) != 1 or len(credits) != 1 or not debits[0].account_name or not credits[0].account_name:
+        return None
+    return f'{debits[0].account_name}|{credits[0].account_name}'
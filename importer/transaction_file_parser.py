@@ -1,4 +1,5 @@
-from .datatypes import JournalEntry, Split, parse_number
+from .datatypes import JournalEntry, Split, parse_amount, parse_number
+from core.amounts import allocate, to_units
 import re
 
 # Copies values verbatim from the source file. Requires CSV schema:
@@ -10,11 +11,11 @@ class PassthroughParser:
         for row_num, row in enumerate(input_rows):
             splits = [Split(account_id=parse_number(row[2], int),
                             account_name=row[3],
-                            amount=parse_number(row[4], float),
+                            amount=parse_amount(row[4]),
                             action=row[5]),
                       Split(account_id=parse_number(row[6], int),
                             account_name=row[7],
-                            amount=parse_number(row[8], float),
+                            amount=parse_amount(row[8]),
                             action=row[9])]
             entries.append(JournalEntry(date=row[0],
                                         description=row[1],
@@ -29,7 +30,7 @@ class BasicMatcherParser:
 
         for row_num, row in enumerate(input_rows):
             date = config['col_map']['date'](row)
-            amount = config['col_map']['amount'](row)
+            amount = to_units(config['col_map']['amount'](row))
             description = config['col_map']['description'](row)
 
             # splits are spec'd by the matcher as either:
@@ -54,8 +55,17 @@ class BasicMatcherParser:
 
                 splits += [Split(**s1), Split(**s2)]
             elif matched_rule and matched_rule['splits']:
-                for split in matched_rule['splits']:
-                    split_amount = (split['percentage'] / 100) * amount
+                # allocate per action so that debits and credits each sum
+                # to exactly the same number of units
+                rule_splits = matched_rule['splits']
+                split_amounts = [None] * len(rule_splits)
+                for action in {split['action'] for split in rule_splits}:
+                    idxs = [i for i, split in enumerate(rule_splits) if split['action'] == action]
+                    parts = allocate(amount, [rule_splits[i]['percentage'] for i in idxs])
+                    for i, part in zip(idxs, parts):
+                        split_amounts[i] = part
+
+                for split, split_amount in zip(rule_splits, split_amounts):
                     split_dict = {**{k: v for k, v in split.items() if k != 'percentage'},
                                   'amount': split_amount}
                     splits.append(Split(**split_dict))
@@ -75,8 +85,14 @@ class BasicMatcherParser:
         return entries
 
 
+# imported on first use, so that the row-based parsers don't need pandas
+def _frame_matcher_parser():
+    from .frame_parser import FrameMatcherParser
+    return FrameMatcherParser()
+
 BUILTIN_PARSERS = {
     'passthrough_parser': PassthroughParser,
     'basic_matcher_parser': BasicMatcherParser,
+    'frame_matcher_parser': _frame_matcher_parser,
 }
 
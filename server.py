@@ -0,0 +1,91 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+import core as sb
+import pandas as pd
+import time
+import traceback
+
+#################################################################
+### Long-lived report server ####################################
+#################################################################
+
+# Keeps a `core.session.ReportSession` warm between requests so shell
+# scripts can run many report variations without re-importing pandas and
+# rebuilding the statement for each one. Binds to localhost only.
+#
+#   curl 'localhost:8790/report/balance_sheet?start=2018-01&end=2019-12'
+#   curl 'localhost:8790/report/income_statement?start=2019-01&end=2019-12&freq=Q&gains=1&format=csv'
+#
+# The data dir is re-checked (stat only) on every request and reloaded if
+# anything changed, so results never go stale.
+
+DEFAULT_PORT = 8790
+
+CONTENT_TYPES = {
+    'text': 'text/plain',
+    'csv': 'text/csv',
+    'html': 'text/html',
+}
+
+def run_server(data_dir, port=DEFAULT_PORT):
+    session = sb.session.ReportSession(data_dir)
+    session.refresh()
+
+    handler = type('ReportRequestHandler', (ReportRequestHandler,), {'session': session})
+    httpd = HTTPServer(('127.0.0.1', port), handler)
+    print(f'Serving reports for {data_dir} on http://127.0.0.1:{port}/report/<type>')
+    print(f'Report types: {", ".join(sb.session.REPORT_TYPES)}')
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print('Shutting down.')
+    finally:
+        httpd.server_close()
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    session = None
+
+    def do_GET(self):
+        start_time = time.perf_counter()
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.strip('/').split('/')
+
+        if path[0] != 'report' or len(path) != 2:
+            self.send_error(404, 'Expected /report/<type>')
+            return
+
+        try:
+            report = path[1]
+            fmt = params.get('format', 'text')
+            with_gains = params.get('gains', '0') not in ['0', 'false', '']
+            period_range = pd.period_range(start=params['start'],
+                                           end=params['end'],
+                                           freq=params.get('freq', 'M'))
+        except KeyError as e:
+            self.send_error(400, f'Missing parameter {e}')
+            return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        try:
+            reloaded = self.session.refresh()
+            body = self.session.render_report(report, period_range, with_gains, fmt).encode('utf-8')
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            # anything else is a bug, but the client still gets a response
+            traceback.print_exc()
+            self.send_error(500, f'{type(e).__name__}: {e}')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', f'{CONTENT_TYPES[fmt]}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Slowbooks-Reloaded', str(reloaded).lower())
+        self.send_header('X-Slowbooks-Time-Ms', f'{(time.perf_counter() - start_time) * 1000:.1f}')
+        self.end_headers()
+        self.wfile.write(body)
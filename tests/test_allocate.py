@@ -0,0 +1,47 @@
+from core.amounts import allocate
+from importer.frame_parser import _allocate_rule_splits
+import numpy as np
+import random
+import unittest
+
+RENT_SPLITS = [
+    {'account_name': 'rent', 'action': 'debit', 'percentage': 66.67},
+    {'account_name': 'groceries', 'action': 'debit', 'percentage': 33.33},
+    {'account_name': 'checking', 'action': 'credit', 'percentage': 100},
+]
+
+class AllocateTest(unittest.TestCase):
+    def test_parts_sum_to_total(self):
+        self.assertEqual(allocate(10001, [66.67, 33.33]), [6668, 3333])
+        self.assertEqual(allocate(100, [33.33, 33.33, 33.34]), [33, 33, 34])
+        self.assertEqual(sum(allocate(1, [50, 50])), 1)
+
+    def test_random_amounts(self):
+        rng = random.Random(1)
+        for _ in range(2000):
+            units = rng.randint(1, 10**9)
+            first = rng.randint(1, 9999) / 100
+            parts = allocate(units, [first, 100 - first])
+            self.assertEqual(sum(parts), units)
+            # each part is within a unit of its exact share
+            for part, percentage in zip(parts, [first, 100 - first]):
+                self.assertLess(abs(part - units * percentage / 100), 1)
+
+    def test_partial_total_rounds_half_to_even(self):
+        # 50% of 3 units is 1.5, and 50% of 5 units is 2.5
+        self.assertEqual(allocate(3, [50]), [2])
+        self.assertEqual(allocate(5, [50]), [2])
+
+class AllocateRuleSplitsTest(unittest.TestCase):
+    def test_matches_allocate(self):
+        units = np.array([1, 2, 3, 100, 10001, 12345, 999999, 2**40 + 1], dtype='int64')
+        parts = _allocate_rule_splits(units, RENT_SPLITS)
+
+        debits = np.column_stack([parts[0]['units'], parts[1]['units']])
+        for row, total in enumerate(units.tolist()):
+            self.assertEqual(debits[row].tolist(), allocate(total, [66.67, 33.33]))
+        self.assertEqual(debits.sum(axis=1).tolist(), units.tolist())
+        self.assertEqual(parts[2]['units'].tolist(), units.tolist())
+
+if __name__ == '__main__':
+    unittest.main()
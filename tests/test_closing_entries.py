@@ -0,0 +1,64 @@
+from pathlib import Path
+import core as sb
+import pandas as pd
+import tempfile
+import unittest
+
+COA = '''id,name,category,type,account_tags,debit_increases_balance,closing_account
+1,checking,cash:bank,asset,,True,
+5,groceries,food:groceries,expense,,True,retained earnings
+6,rent,housing:rent,expense,,True,retained earnings
+8,retained earnings,equity:re,equity,,False,
+'''
+
+JOURNAL = '''id,date,description,account_id,account_name,action,amount
+1,2019-01-05,rent jan,6,rent,debit,1000.00
+1,2019-01-05,rent jan,1,checking,credit,1000.00
+2,2019-01-10,grocer,5,groceries,debit,10.00
+2,2019-01-10,grocer,1,checking,credit,10.00
+3,2019-01-20,grocer refund,1,checking,debit,25.00
+3,2019-01-20,grocer refund,5,groceries,credit,25.00
+'''
+
+class ClosingEntriesTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        data_dir = Path(tmp_dir.name)
+        (data_dir / 'master').mkdir()
+        (data_dir / 'master/chart_of_accounts.csv').write_text(COA)
+        (data_dir / 'master/master_journal.csv').write_text(JOURNAL)
+
+        self.period_range = pd.period_range('2019-01', '2019-01', freq='M')
+        coa = sb.data.fetch_chart_of_accounts(data_dir)
+        self.stmt_data = sb.data.statement_data(coa, sb.data.fetch_master_journal(data_dir, coa), self.period_range)
+
+    def closing_entry(self, account_name):
+        rows = self.stmt_data[self.stmt_data['description'] == f'Closing entry for: {account_name}']
+        self.assertEqual(len(rows), 1)
+        return rows.iloc[0]
+
+    def test_expense_closes_as_debit(self):
+        entry = self.closing_entry('rent')
+        self.assertEqual(entry['account_name'], 'retained earnings')
+        self.assertEqual(entry['action'], 'debit')
+        self.assertEqual((entry['debit_amount'], entry['credit_amount']), (100000, 0))
+        self.assertEqual(entry['net_amount'], -100000)
+
+    # refunds exceeding purchases leave the expense account with a credit
+    # net, which closes into retained earnings as a credit
+    def test_refunded_expense_closes_as_credit(self):
+        entry = self.closing_entry('groceries')
+        self.assertEqual(entry['account_name'], 'retained earnings')
+        self.assertEqual(entry['action'], 'credit')
+        self.assertEqual((entry['debit_amount'], entry['credit_amount']), (0, 1500))
+        self.assertEqual(entry['net_amount'], 1500)
+
+    # a net loss of 985.00 (rent less the net refund) reduces equity
+    def test_retained_earnings_balance(self):
+        bs = sb.data.balance_sheet(self.stmt_data, self.period_range)
+        retained = bs.xs('retained earnings', level='account_name')['bs_amount']
+        self.assertEqual(retained.tolist(), [-98500])
+
+if __name__ == '__main__':
+    unittest.main()
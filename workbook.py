@@ -1,6 +1,7 @@
 import core as sb
 import numpy as np
 import pandas as pd
+import sys
 
 #################################################################
 ### Workbook for generally messing around with the data #########
@@ -16,14 +17,17 @@ def run_workbook(data_dir):
     coa = sb.data.fetch_chart_of_accounts(data_dir)
     mj = sb.data.fetch_master_journal(data_dir, coa)
     bd = sb.data.fetch_balance_data(data_dir)
-    sd = sb.data.statement_data(coa, mj, period_range, with_gains=True, balance_data=bd)
 
-    gl = sb.data.general_ledger(sd)
-    cf = sb.data.cash_flow(sd, period_range)
-    bs = sb.data.balance_sheet(sd, period_range)
+    # closed periods come from snapshots (see `slowbooks close`), the
+    # statement is only built if any periods are still open
+    snapshots = sb.snapshots.SnapshotStore(data_dir).reports(coa, mj, period_range, with_gains=True,
+                                                            balance_data=bd)
+    cf = snapshots.cash_flow
+    bs = snapshots.balance_sheet
+    if snapshots.invalidated:
+        print(f'[workbook] snapshots from {snapshots.invalidated[0]} are stale, rerun `slowbooks close`', file=sys.stderr)
 
 
-    glr = sb.reports.general_ledger(gl)
     isr = sb.reports.income_statement(cf)
     cfr = sb.reports.cashflow_statement(cf)
     bsr = sb.reports.balance_sheet(bs)